@@ -1,11 +1,25 @@
 from NN.Errors import *
 from NN.Basic.Optimizers import *
+from NN.Basic.Workspace import Workspace
+
+
+def col2im_6d_numpy(cols, n, n_channels, height, width, filter_height, filter_width, pad, stride):
+    out_h = (height + 2 * pad - filter_height) // stride + 1
+    out_w = (width + 2 * pad - filter_width) // stride + 1
+    x_padded = np.zeros((n, n_channels, height + 2 * pad, width + 2 * pad), dtype=cols.dtype)
+    for i in range(filter_height):
+        for j in range(filter_width):
+            x_padded[:, :, i:i + stride * out_h:stride, j:j + stride * out_w:stride] += (
+                cols[:, i, j].transpose(1, 0, 2, 3))
+    if pad > 0:
+        return x_padded[:, :, pad:-pad, pad:-pad]
+    return x_padded
+
 
 try:
-    from NN.Basic.CFunc.core import col2im_6d_cython
+    from NN.Basic.CFunc.core import col2im_6d_cython as col2im_6d
 except ImportError:
-    print("Cython codes are not compiled, naive cnn bp algorithm will be used.")
-    col2im_6d_cython = lambda *args, **kwargs: np.array([])
+    col2im_6d = col2im_6d_numpy
 
 
 # Abstract Layers
@@ -14,6 +28,10 @@ class Layer(metaclass=ABCMeta):
 
     LayerTiming = Timing()
 
+    # Activations are computed in the buffer of the pre-activation (x.dot(w) + b, which belongs to the layer)
+    # if 'inplace' is set. This is valid as long as derivatives do not need the pre-activation
+    inplace = True
+
     def __init__(self, shape):
         """
         :param shape: shape[0] = units of previous layer
@@ -27,6 +45,7 @@ class Layer(metaclass=ABCMeta):
         self.is_last_root = False
         self.is_sub_layer = False
         self._last_sub_layer = None
+        self.workspace = Workspace()
 
     def __str__(self):
         return self.__class__.__name__
@@ -96,19 +115,29 @@ class Layer(metaclass=ABCMeta):
             if bias is None:
                 return self._activate(x, predict)
             return self._activate(x + bias, predict)
-        if bias is None:
-            return self._activate(x.dot(w), predict)
-        return self._activate(x.dot(w) + bias, predict)
+        _linear = np.dot(x, w, out=self._get_buffer(
+            "linear", (x.shape[0], w.shape[1]), np.result_type(x, w), predict))
+        if bias is not None:
+            _linear += bias
+        return self._activate(_linear, predict)
 
     @LayerTiming.timeit(level=1, prefix="[Core] ")
     def bp(self, y, w, prev_delta):
+        # Derivative of a root Layer is applied after the derivatives of its SubLayers,
+        # since SubLayers are stacked upon the activation of the root Layer
         if self.child is not None and isinstance(self.child, SubLayer):
-            if not isinstance(self, SubLayer):
+            if isinstance(self, SubLayer):
+                return self._derivative(y, prev_delta)
+            # Common CostLayers apply the derivative of their root in 'bp_first' already
+            if isinstance(self.child, CostLayer) and not isinstance(self.child, FusedCostLayer):
                 return prev_delta
-            return self._derivative(y, prev_delta)
+            return np.multiply(prev_delta, self._derivative(y), out=self._buffer_like("delta", prev_delta))
+        delta = np.dot(prev_delta, w.T, out=self._get_buffer(
+            "delta", (prev_delta.shape[0], w.shape[0]), np.result_type(prev_delta, w)))
         if isinstance(self, SubLayer):
-            return self._derivative(y, prev_delta.dot(w.T) * self._root.derivative(y))
-        return prev_delta.dot(w.T) * self._derivative(y)
+            return self._derivative(y, delta)
+        delta *= self._derivative(y)
+        return delta
 
     @abstractmethod
     def _activate(self, x, predict):
@@ -120,10 +149,36 @@ class Layer(metaclass=ABCMeta):
 
     # Util
 
+    def _get_buffer(self, key, shape, dtype, predict=False):
+        """
+        Buffers are only handed out while training, because results of predictions are
+        returned to (and kept by) the caller
+        :return: None if predict, so the result can be passed to the 'out' argument of ufuncs
+        """
+        if predict:
+            return None
+        return self.workspace.get(key, shape, dtype)
+
+    def _buffer_like(self, key, x, predict=False):
+        return self._get_buffer(key, x.shape, x.dtype, predict)
+
+    def _activation_buffer(self, x, predict=False):
+        """
+        :return: x itself if activations are computed in place, a copy of x otherwise
+        """
+        if self.inplace:
+            return x
+        _rs = self._buffer_like("activation", x, predict)
+        if _rs is None:
+            return x.copy()
+        np.copyto(_rs, x)
+        return _rs
+
     @staticmethod
     @LayerTiming.timeit(level=2, prefix="[Core Util] ")
-    def safe_exp(y):
-        return np.exp(y - np.max(y, axis=1, keepdims=True))
+    def safe_exp(y, out=None):
+        _rs = np.subtract(y, np.max(y, axis=1, keepdims=True), out=out)
+        return np.exp(_rs, out=_rs)
 
 
 class SubLayer(Layer):
@@ -200,6 +255,48 @@ class ConvLayer(Layer):
     def padding(self):
         return self._padding
 
+    def _is_direct(self, w):
+        return w.shape[2] == w.shape[3] == 1 and self._padding == 0
+
+    def _get_x_padded(self, x, predict):
+        p = self._padding
+        if p == 0:
+            return x
+        n, n_channels, height, width = x.shape
+        shape = (n, n_channels, height + 2 * p, width + 2 * p)
+        if predict:
+            x_padded = np.zeros(shape, x.dtype)
+        else:
+            x_padded = self.workspace.get("x_padded", shape, x.dtype, np.zeros)
+        x_padded[:, :, p:-p, p:-p] = x
+        return x_padded
+
+    def _get_x_cols(self, x, w, predict):
+        """
+        :return: columns of shape (n_channels * filter_height * filter_width, n * out_h * out_w)
+        """
+        n, n_channels = x.shape[:2]
+        _, _, filter_height, filter_width = w.shape
+        x_padded = self._get_x_padded(x, predict)
+        s0, s1, s2, s3 = x_padded.strides
+        shape = (n_channels, filter_height, filter_width, n, self.out_h, self.out_w)
+        x_cols = np.lib.stride_tricks.as_strided(
+            x_padded, shape=shape, strides=(s1, s2, s3, s0, s2 * self._stride, s3 * self._stride), writeable=False)
+        if predict:
+            return x_cols.reshape(shape[0] * shape[1] * shape[2], -1)
+        _buffer = self.workspace.get("x_cols", shape, x.dtype)
+        np.copyto(_buffer, x_cols)
+        return _buffer.reshape(shape[0] * shape[1] * shape[2], -1)
+
+    def _get_x_direct(self, x):
+        """
+        1x1 kernels without padding need no im2col, the (strided) input itself is the column matrix of each sample
+        :return: array of shape (n, n_channels, out_h * out_w)
+        """
+        if self._stride > 1:
+            x = np.ascontiguousarray(x[:, :, ::self._stride, ::self._stride])
+        return x.reshape(x.shape[0], x.shape[1], -1)
+
     def _activate(self, x, predict):
         raise NotImplementedError("Please implement activation function for " + self.name)
 
@@ -258,6 +355,28 @@ class ConvPoolLayer(ConvLayer):
     def bp(self, y, w, prev_delta):
         return self._derivative(y, w, prev_delta)
 
+    def _get_windows(self, x):
+        n, n_channels, height, width = x.shape
+        s0, s1, s2, s3 = x.strides
+        return np.lib.stride_tricks.as_strided(
+            x, shape=(n, n_channels, self.out_h, self.out_w) + tuple(self._shape[1]),
+            strides=(s0, s1, s2 * self._stride, s3 * self._stride, s2, s3), writeable=False)
+
+    def _get_delta(self, y, w, prev_delta):
+        if isinstance(prev_delta, tuple):
+            prev_delta = prev_delta[0]
+        if self.is_fc_base:
+            return prev_delta.dot(w.T).reshape(y.shape)
+        return prev_delta
+
+    def _scatter_windows(self, get_delta):
+        dx, sd = np.zeros_like(self.x_cache), self._stride
+        pool_height, pool_width = self._shape[1]
+        for i in range(pool_height):
+            for j in range(pool_width):
+                dx[:, :, i:i + sd * self.out_h:sd, j:j + sd * self.out_w:sd] += get_delta(i, j)
+        return dx
+
 
 class ConvMeta(type):
 
@@ -270,67 +389,70 @@ class ConvMeta(type):
 
         def _activate(self, x, w, bias, predict):
             self.x_cache, self.w_cache = x, w
-            n, n_channels, height, width = x.shape
-            n_filters, _, filter_height, filter_width = w.shape
-
-            p, sd = self._padding, self._stride
-            x_padded = np.pad(x, ((0, 0), (0, 0), (p, p), (p, p)), mode='constant')
-
-            height += 2 * p
-            width += 2 * p
-
-            shape = (n_channels, filter_height, filter_width, n, self.out_h, self.out_w)
-            strides = (height * width, width, 1, n_channels * height * width, sd * width, sd)
-            strides = x.itemsize * np.array(strides)
-            x_cols = np.lib.stride_tricks.as_strided(x_padded, shape=shape, strides=strides).reshape(
-                n_channels * filter_height * filter_width, n * self.out_h * self.out_w)
-            self.x_col_cache = x_cols
-
-            if bias is None:
-                res = w.reshape(n_filters, -1).dot(x_cols)
+            n = len(x)
+            n_filters = w.shape[0]
+            _dtype = np.result_type(x, w)
+
+            if self._is_direct(w):
+                # res is laid out as (n, n_filters, out_h * out_w), which is already the layout of outputs
+                x_cols = self._get_x_direct(x)
+                res = np.matmul(w.reshape(n_filters, -1), x_cols, out=self._get_buffer(
+                    "res", (n, n_filters, x_cols.shape[2]), _dtype, predict))
+                if bias is not None:
+                    res += bias.reshape(1, -1, 1)
+                res = res.reshape(n, n_filters, self.out_h, self.out_w)
             else:
-                res = w.reshape(n_filters, -1).dot(x_cols) + bias.reshape(-1, 1)
-            res.shape = (n_filters, n, self.out_h, self.out_w)
-            return layer._activate(self, res.transpose(1, 0, 2, 3), predict)
+                # res is laid out as (n_filters, n, out_h, out_w) so that both the im2col copy and the GEMM
+                # run over contiguous memory, the transpose below is a view and is consumed by the activation
+                x_cols = self._get_x_cols(x, w, predict)
+                res = np.dot(w.reshape(n_filters, -1), x_cols, out=self._get_buffer(
+                    "res", (n_filters, x_cols.shape[1]), _dtype, predict))
+                if bias is not None:
+                    res += bias.reshape(-1, 1)
+                res = res.reshape(n_filters, n, self.out_h, self.out_w).transpose(1, 0, 2, 3)
+            self.x_col_cache = x_cols
+            return layer._activate(self, res, predict)
 
         def _derivative(self, y, w, prev_delta):
             n = len(y)
             n_channels, height, width = self._shape[0]
-            n_filters, filter_height, filter_width = self._shape[1]
+            n_filters, filter_height, filter_width = self.w_cache.shape[0], *self.w_cache.shape[2:]
+            _dtype = np.result_type(y, self.w_cache)
 
-            p, sd = self._padding, self._stride
             if isinstance(prev_delta, tuple):
                 prev_delta = prev_delta[0]
 
             __derivative = self.LayerTiming.timeit(level=1, name="bp", cls_name=name, prefix="[Core] ")(
-                layer.derivative)
+                layer._derivative)
             if self.is_fc_base:
-                delta = __derivative(self, y) * prev_delta.dot(w.T).reshape(y.shape)
-            else:
-                delta = __derivative(self, y) * prev_delta
-
-            dw = delta.transpose(1, 0, 2, 3).reshape(n_filters, -1).dot(
-                self.x_col_cache.T).reshape(self.w_cache.shape)
-            db = np.sum(delta, axis=(0, 2, 3))
-
-            n_filters, _, filter_height, filter_width = self.w_cache.shape
-            _, _, out_h, out_w = delta.shape
-
-            if col2im_6d_cython is not None:
-                dx_cols = self.w_cache.reshape(n_filters, -1).T.dot(delta.transpose(1, 0, 2, 3).reshape(n_filters, -1))
-                dx_cols.shape = (n_channels, filter_height, filter_width, n, out_h, out_w)
-                dx = col2im_6d_cython(
-                    dx_cols, n, n_channels, height, width, filter_height, filter_width, self._padding, self._stride)
-            else:
-                dx_padded = np.zeros((n, n_channels, height + 2 * p, width + 2 * p))
-                for i in range(n):
-                    for f in range(n_filters):
-                        for j in range(self.out_h):
-                            for k in range(self.out_w):
-                                dx_padded[i, :, j * sd:filter_height + j * sd, k * sd:filter_width + k * sd] += (
-                                    self.w_cache[f] * delta[i, f, j, k])
-                dx = dx_padded[:, :, p:-p, p:-p] if p > 0 else dx_padded
-            return dx, dw, db
+                prev_delta = prev_delta.dot(w.T).reshape(y.shape)
+            w_flat = self.w_cache.reshape(n_filters, -1)
+            dw = self.workspace.get("dw", w_flat.shape, _dtype)
+            db = self.workspace.get("db", (n_filters, ), _dtype)
+
+            if self._is_direct(self.w_cache):
+                delta = np.multiply(__derivative(self, y), prev_delta, out=self.workspace.get("delta", y.shape, _dtype))
+                delta = delta.reshape(n, n_filters, -1)
+                np.sum(np.matmul(delta, self.x_col_cache.transpose(0, 2, 1)), axis=0, out=dw)
+                np.sum(delta, axis=(0, 2), out=db)
+                dx = np.matmul(w_flat.T, delta).reshape(n, n_channels, self.out_h, self.out_w)
+                if self._stride > 1:
+                    _dx, dx = dx, np.zeros((n, n_channels, height, width), _dtype)
+                    dx[:, :, ::self._stride, ::self._stride] = _dx
+                return dx, dw.reshape(self.w_cache.shape), db
+
+            # delta is written through a transposed view, so that it is laid out as (n_filters, n * out_h * out_w)
+            delta = self.workspace.get("delta", (n_filters, n, self.out_h, self.out_w), _dtype)
+            np.multiply(__derivative(self, y), prev_delta, out=delta.transpose(1, 0, 2, 3))
+            delta = delta.reshape(n_filters, -1)
+            np.dot(delta, self.x_col_cache.T, out=dw)
+            np.sum(delta, axis=1, out=db)
+
+            dx_cols = np.dot(w_flat.T, delta, out=self.workspace.get("dx_cols", self.x_col_cache.shape, _dtype))
+            dx_cols = dx_cols.reshape(n_channels, filter_height, filter_width, n, self.out_h, self.out_w)
+            dx = col2im_6d(
+                dx_cols, n, n_channels, height, width, filter_height, filter_width, self._padding, self._stride)
+            return dx, dw.reshape(self.w_cache.shape), db
 
         def activate(self, x, w, bias=None, predict=False):
             return self.LayerTiming.timeit(level=1, name="activate", cls_name=name, prefix="[Core] ")(
@@ -354,26 +476,26 @@ class ConvSubMeta(type):
         conv_layer, sub_layer = bases
 
         def __init__(self, parent, shape, *_args, **_kwargs):
-            conv_layer.__init__(self, parent.shape, parent.stride, parent.padding)
+            # The parent may be a pooling layer, whose shape does not contain filter sizes
+            conv_layer.__init__(self, (parent.shape[0], ), parent.stride, parent.padding)
+            self.n_channels, self.n_filters = parent.n_channels, parent.n_filters
             self.out_h, self.out_w = parent.out_h, parent.out_w
             sub_layer.__init__(self, parent, shape, *_args, **_kwargs)
             if name == "ConvNorm":
                 self.gamma, self.beta = np.ones(self.n_filters), np.zeros(self.n_filters)
-                self.init_optimizers()
+
+        @property
+        def params(self):
+            # Shape, stride & padding come from the parent, only params of the SubLayer are needed to rebuild it
+            return sub_layer.params.fget(self)
 
         def _activate(self, x, predict):
-            n, n_channels, height, width = x.shape
-            x_new = x.transpose(0, 2, 3, 1).reshape(-1, n_channels)
-            out = sub_layer._activate(self, x_new, predict)
-            return out.reshape(n, height, width, n_channels).transpose(0, 3, 1, 2)
+            return sub_layer._activate(self, x, predict)
 
         def _derivative(self, y, w, delta=None):
             if self.is_fc_base:
                 delta = delta.dot(w.T).reshape(y.shape)
-            n, n_channels, height, width = delta.shape
-            delta_new = delta.transpose(0, 2, 3, 1).reshape(-1, n_channels)
-            dx = sub_layer.derivative(self, None, delta_new)
-            return dx.reshape(n, height, width, n_channels).transpose(0, 3, 1, 2)
+            return sub_layer._derivative(self, None, delta)
 
         def activate(self, x, w, bias=None, predict=False):
             return self.LayerTiming.timeit(level=1, name="activate", cls_name=name, prefix="[Core] ")(
@@ -405,50 +527,160 @@ class ConvSubLayerMeta(ABCMeta, ConvSubMeta):
 class Tanh(Layer):
 
     def _activate(self, x, predict):
-        return np.tanh(x)
+        _rs = self._activation_buffer(x, predict)
+        return np.tanh(_rs, out=_rs)
 
     def _derivative(self, y, delta=None):
-        return 1 - y ** 2
+        _rs = np.square(y, out=self._buffer_like("derivative", y))
+        return np.subtract(1, _rs, out=_rs)
 
 
 class Sigmoid(Layer):
 
     def _activate(self, x, predict):
-        return 1 / (1 + np.exp(-x))
+        _rs = np.negative(x, out=self._activation_buffer(x, predict))
+        np.exp(_rs, out=_rs)
+        _rs += 1
+        return np.reciprocal(_rs, out=_rs)
 
     def _derivative(self, y, delta=None):
-        return y * (1 - y)
+        _rs = np.subtract(1, y, out=self._buffer_like("derivative", y))
+        _rs *= y
+        return _rs
 
 
 class ELU(Layer):
 
     def _activate(self, x, predict):
-        _rs, _rs0 = x.copy(), x < 0
-        _rs[_rs0] = np.exp(_rs[_rs0]) - 1
-        return _rs
+        _rs = self._activation_buffer(x, predict)
+        _mask = np.less(_rs, 0, out=self._get_buffer("mask", x.shape, bool, predict))
+        return np.expm1(_rs, out=_rs, where=_mask)
 
     def _derivative(self, y, delta=None):
-        _rs, _indices = np.ones(y.shape), y < 0
-        _rs[_indices] = y[_indices] + 1
+        _rs = np.minimum(y, 0, out=self._buffer_like("derivative", y))
+        _rs += 1
         return _rs
 
 
 class ReLU(Layer):
 
     def _activate(self, x, predict):
-        return np.maximum(0, x)
+        _rs = self._activation_buffer(x, predict)
+        return np.maximum(_rs, 0, out=_rs)
+
+    def _derivative(self, y, delta=None):
+        return np.greater(y, 0, out=self._get_buffer("derivative", y.shape, bool))
+
+
+class LeakyReLU(Layer):
+
+    alpha = 0.01
+
+    def _activate(self, x, predict):
+        _rs = self._activation_buffer(x, predict)
+        _mask = np.less(_rs, 0, out=self._get_buffer("mask", x.shape, bool, predict))
+        return np.multiply(_rs, self.alpha, out=_rs, where=_mask)
+
+    def _derivative(self, y, delta=None):
+        # 1 if y > 0 else alpha
+        _rs = np.less_equal(y, 0, out=self._buffer_like("derivative", y))
+        _rs *= self.alpha - 1
+        _rs += 1
+        return _rs
+
+
+class SELU(Layer):
+
+    alpha = 1.6732632423543772
+    scale = 1.0507009873554805
+
+    def _activate(self, x, predict):
+        _rs = self._activation_buffer(x, predict)
+        _mask = np.less(_rs, 0, out=self._get_buffer("mask", x.shape, bool, predict))
+        np.expm1(_rs, out=_rs, where=_mask)
+        np.multiply(_rs, self.alpha, out=_rs, where=_mask)
+        _rs *= self.scale
+        return _rs
+
+    def _derivative(self, y, delta=None):
+        # scale if y > 0 else y + scale * alpha
+        _rs = np.add(y, self.scale * self.alpha, out=self._buffer_like("derivative", y))
+        _mask = np.greater(y, 0, out=self._get_buffer("mask", y.shape, bool))
+        np.copyto(_rs, self.scale, where=_mask)
+        return _rs
+
+
+class Swish(Layer):
+
+    def _activate(self, x, predict):
+        _sigmoid = np.negative(x, out=self._buffer_like("sigmoid", x, predict))
+        np.exp(_sigmoid, out=_sigmoid)
+        _sigmoid += 1
+        np.reciprocal(_sigmoid, out=_sigmoid)
+        if not predict:
+            self.sigmoid_cache = _sigmoid
+        _rs = self._activation_buffer(x, predict)
+        _rs *= _sigmoid
+        return _rs
+
+    def _derivative(self, y, delta=None):
+        # sigmoid + x * sigmoid * (1 - sigmoid) = y + sigmoid * (1 - y)
+        _rs = np.subtract(1, y, out=self._buffer_like("derivative", y))
+        _rs *= self.sigmoid_cache
+        _rs += y
+        return _rs
+
+
+class GELU(Layer):
+    """
+    Tanh approximation of GELU: 0.5 * x * (1 + tanh(sqrt(2 / pi) * (x + 0.044715 * x ** 3)))
+    Its derivative needs x, so it is never computed in place
+    """
+
+    inplace = False
+    c0, c1 = np.sqrt(2 / np.pi), 0.044715
+
+    def _activate(self, x, predict):
+        _rs = np.square(x, out=self._buffer_like("activation", x, predict))
+        _rs *= self.c1
+        _rs += 1
+        _rs *= x
+        _rs *= self.c0
+        _tanh = np.tanh(_rs, out=self._buffer_like("tanh", x, predict))
+        if not predict:
+            self.x_linear_cache, self.tanh_cache = x, _tanh
+        np.add(_tanh, 1, out=_rs)
+        _rs *= x
+        _rs *= 0.5
+        return _rs
 
     def _derivative(self, y, delta=None):
-        return y > 0
+        # 0.5 * (1 + tanh) + 0.5 * x * (1 - tanh ** 2) * c0 * (1 + 3 * c1 * x ** 2)
+        x, _tanh = self.x_linear_cache, self.tanh_cache
+        _rs = np.square(_tanh, out=self._buffer_like("derivative", y))
+        np.subtract(1, _rs, out=_rs)
+        _rs *= x
+        _rs *= self.c0
+        _tmp = np.square(x, out=self._buffer_like("derivative_tmp", y))
+        _tmp *= 3 * self.c1
+        _tmp += 1
+        _rs *= _tmp
+        _rs += _tanh
+        _rs += 1
+        _rs *= 0.5
+        return _rs
 
 
 class Softplus(Layer):
 
     def _activate(self, x, predict):
-        return np.log(1 + np.exp(x))
+        _rs = np.exp(x, out=self._activation_buffer(x, predict))
+        return np.log1p(_rs, out=_rs)
 
     def _derivative(self, y, delta=None):
-        return 1 - 1 / np.exp(y)
+        _rs = np.negative(y, out=self._buffer_like("derivative", y))
+        np.exp(_rs, out=_rs)
+        return np.subtract(1, _rs, out=_rs)
 
 
 class Identical(Layer):
@@ -463,11 +695,14 @@ class Identical(Layer):
 class Softmax(Layer):
 
     def _activate(self, x, predict):
-        exp_y = Layer.safe_exp(x)
-        return exp_y / np.sum(exp_y, axis=1, keepdims=True)
+        exp_y = Layer.safe_exp(x, out=self._activation_buffer(x, predict))
+        exp_y /= np.sum(exp_y, axis=1, keepdims=True)
+        return exp_y
 
     def _derivative(self, y, delta=None):
-        return y * (1 - y)
+        _rs = np.subtract(1, y, out=self._buffer_like("derivative", y))
+        _rs *= y
+        return _rs
 
 
 # Convolution Layers
@@ -488,6 +723,22 @@ class ConvReLU(ConvLayer, ReLU, metaclass=ConvLayerMeta):
     pass
 
 
+class ConvLeakyReLU(ConvLayer, LeakyReLU, metaclass=ConvLayerMeta):
+    pass
+
+
+class ConvSELU(ConvLayer, SELU, metaclass=ConvLayerMeta):
+    pass
+
+
+class ConvSwish(ConvLayer, Swish, metaclass=ConvLayerMeta):
+    pass
+
+
+class ConvGELU(ConvLayer, GELU, metaclass=ConvLayerMeta):
+    pass
+
+
 class ConvSoftplus(ConvLayer, Softplus, metaclass=ConvLayerMeta):
     pass
 
@@ -518,24 +769,14 @@ class MaxPool(ConvPoolLayer):
             out = x_reshaped.max(axis=3).max(axis=4)
             self._pool_cache["method"] = "reshape"
         else:
-            out = np.zeros((n, n_channels, self.out_h, self.out_w))
-            for i in range(n):
-                for j in range(n_channels):
-                    for k in range(self.out_h):
-                        for l in range(self.out_w):
-                            window = x[i, j, k * sd:pool_height + k * sd, l * sd:pool_width + l * sd]
-                            out[i, j, k, l] = np.max(window)
-            self._pool_cache["method"] = "original"
+            windows = self._get_windows(x).reshape(n, n_channels, self.out_h, self.out_w, -1)
+            self._pool_cache["argmax"] = _arg = np.argmax(windows, axis=4)
+            out = np.take_along_axis(windows, _arg[..., None], axis=4)[..., 0]
+            self._pool_cache["method"] = "strided"
         return out
 
     def _derivative(self, y, *args):
-        w, prev_delta = args
-        if isinstance(prev_delta, tuple):
-            prev_delta = prev_delta[0]
-        if self.is_fc_base:
-            delta = prev_delta.dot(w.T).reshape(y.shape)
-        else:
-            delta = prev_delta
+        delta = self._get_delta(y, *args)
         method = self._pool_cache["method"]
         if method == "reshape":
             x_reshaped_cache = self._pool_cache["x_reshaped"]
@@ -547,23 +788,26 @@ class MaxPool(ConvPoolLayer):
             dx_reshaped[mask] = dout_broadcast[mask]
             dx_reshaped /= np.sum(mask, axis=(3, 5), keepdims=True)
             dx = dx_reshaped.reshape(self.x_cache.shape)
-        elif method == "original":
-            sd = self._stride
-            dx = np.zeros_like(self.x_cache)
-            n, n_channels, _, _ = self.x_cache.shape
-            pool_height, pool_width = self._shape[1]
-            for i in range(n):
-                for j in range(n_channels):
-                    for k in range(self.out_h):
-                        for l in range(self.out_w):
-                            window = self.x_cache[i, j, k*sd:pool_height+k*sd, l*sd:pool_width+l*sd]
-                            dx[i, j, k*sd:pool_height+k*sd, l*sd:pool_width+l*sd] = (
-                                window == np.max(window)) * delta[i, j, k, l]
+        elif method == "strided":
+            _arg = self._pool_cache["argmax"]
+            pool_width = self._shape[1][1]
+            dx = self._scatter_windows(lambda i, j: delta * (_arg == i * pool_width + j))
         else:
             raise LayerError("Undefined pooling method '{}' found".format(method))
         return dx, None, None
 
 
+class AvgPool(ConvPoolLayer):
+
+    def _activate(self, x, *args):
+        self.x_cache = x
+        return self._get_windows(x).mean(axis=(4, 5))
+
+    def _derivative(self, y, *args):
+        delta = self._get_delta(y, *args) / np.prod(self._shape[1])
+        return self._scatter_windows(lambda i, j: delta), None, None
+
+
 # Special Layer
 
 class Dropout(SubLayer):
@@ -574,96 +818,110 @@ class Dropout(SubLayer):
         SubLayer.__init__(self, parent, shape)
         self._prob = prob
         self._prob_inv = 1 / (1 - prob)
+        self._mask = None
         self.description = "(Drop prob: {})".format(prob)
 
+    @property
+    def params(self):
+        return self._prob,
+
     def _activate(self, x, predict):
-        if not predict:
-            _diag = np.diag(np.random.random(x.shape[1]) >= self._prob) * self._prob_inv
-        else:
-            _diag = np.eye(x.shape[1])
-        return x.dot(_diag)
+        if predict:
+            return x
+        self._mask = np.greater_equal(np.random.random(x.shape), self._prob, out=self._buffer_like("mask", x))
+        self._mask *= self._prob_inv
+        return np.multiply(x, self._mask, out=self._buffer_like("activation", x))
 
     def _derivative(self, y, delta=None):
-        return self._prob_inv * delta
+        return np.multiply(delta, self._mask, out=self._buffer_like("derivative", delta))
 
 
 class Normalize(SubLayer):
 
-    def __init__(self, parent, shape, lr=0.001, eps=1e-8, momentum=0.9, optimizers=None):
+    def __init__(self, parent, shape, eps=1e-8, momentum=0.9):
         SubLayer.__init__(self, parent, shape)
-        self.sample_mean, self.sample_var = None, None
+        self.sample_mean, self.sample_var, self.sample_std_inv = None, None, None
         self.running_mean, self.running_var = None, None
-        self.x_cache, self.x_normalized_cache = None, None
-        self._lr, self._eps = lr, eps
-        if optimizers is None:
-            self._g_optimizer, self._b_optimizer = Adam(self._lr), Adam(self._lr)
-        else:
-            self._g_optimizer, self._b_optimizer = optimizers
+        self.x_cache = None
+        self.d_gamma, self.d_beta = None, None
+        self._eps, self._momentum = eps, momentum
         self.gamma, self.beta = np.ones(self.shape[1]), np.zeros(self.shape[1])
-        self._momentum = momentum
-        self.init_optimizers()
-        self.description = "(lr: {}, eps: {}, momentum: {}, optimizer: ({}, {}))".format(
-            lr, eps, momentum, self._g_optimizer.name, self._b_optimizer.name
-        )
+        self.description = "(eps: {}, momentum: {})".format(eps, momentum)
 
     @property
     def params(self):
-        return self._lr, self._eps, self._momentum, (self._g_optimizer.name, self._b_optimizer.name)
+        return self._eps, self._momentum
 
     @property
     def special_params(self):
         return {
             "gamma": self.gamma, "beta": self.beta,
-            "running_mean": self.running_mean, "running_var": self.running_var,
-            "_g_optimizer": self._g_optimizer, "_b_optimizer": self._b_optimizer
+            "running_mean": self.running_mean, "running_var": self.running_var
         }
 
-    def init_optimizers(self):
-        _opt_fac = OptFactory()
-        if not isinstance(self._g_optimizer, Optimizers):
-            self._g_optimizer = _opt_fac.get_optimizer_by_name(
-                self._g_optimizer, None, self.LayerTiming, self._lr, None
-            )
-        if not isinstance(self._b_optimizer, Optimizers):
-            self._b_optimizer = _opt_fac.get_optimizer_by_name(
-                self._b_optimizer, None, self.LayerTiming, self._lr, None
-            )
-        self._g_optimizer.feed_variables([self.gamma])
-        self._b_optimizer.feed_variables([self.beta])
+    # Statistics are reduced over every axis but the feature (channel) axis, so that
+    # ConvNorm works on (n, c, h, w) batches directly
+
+    @staticmethod
+    def _get_axes(x):
+        return (0, ) if x.ndim == 2 else (0, 2, 3)
+
+    @staticmethod
+    def _get_sum_of_products(x, y):
+        _subscripts = "ij,ij->j" if x.ndim == 2 else "ijkl,ijkl->j"
+        return np.einsum(_subscripts, x, y, dtype=np.float64)
+
+    @staticmethod
+    def _broadcast(x, param):
+        return param if x.ndim == 2 else param.reshape(1, -1, 1, 1)
 
     def _activate(self, x, predict):
+        if self.gamma.dtype != x.dtype:
+            self.gamma, self.beta = self.gamma.astype(x.dtype), self.beta.astype(x.dtype)
         if self.running_mean is None or self.running_var is None:
-            self.running_mean, self.running_var = np.zeros(x.shape[1]), np.zeros(x.shape[1])
+            self.running_mean = np.zeros(x.shape[1], dtype=x.dtype)
+            self.running_var = np.zeros(x.shape[1], dtype=x.dtype)
         if not predict:
-            self.sample_mean = np.mean(x, axis=0, keepdims=True)
-            self.sample_var = np.var(x, axis=0, keepdims=True)
-            x_normalized = (x - self.sample_mean) / np.sqrt(self.sample_var + self._eps)
-            self.x_cache, self.x_normalized_cache = x, x_normalized
-            out = self.gamma * x_normalized + self.beta
-            self.running_mean = self._momentum * self.running_mean + (1 - self._momentum) * self.sample_mean
-            self.running_var = self._momentum * self.running_var + (1 - self._momentum) * self.sample_var
+            # One pass statistics: sum & sum of squares, accumulated in float64
+            n = x.size // x.shape[1]
+            self.sample_mean = np.sum(x, axis=self._get_axes(x), dtype=np.float64) / n
+            self.sample_var = self._get_sum_of_products(x, x) / n - self.sample_mean ** 2
+            np.maximum(self.sample_var, 0, out=self.sample_var)
+            self.sample_std_inv = 1 / np.sqrt(self.sample_var + self._eps)
+            self.x_cache = x
+            self.running_mean *= self._momentum
+            self.running_mean += (1 - self._momentum) * self.sample_mean
+            self.running_var *= self._momentum
+            self.running_var += (1 - self._momentum) * self.sample_var
+            mean, std_inv = self.sample_mean, self.sample_std_inv
         else:
-            x_normalized = (x - self.running_mean) / np.sqrt(self.running_var + self._eps)
-            out = self.gamma * x_normalized + self.beta
+            mean, std_inv = self.running_mean, 1 / np.sqrt(self.running_var + self._eps)
+        # gamma * (x - mean) * std_inv + beta = x * scale + shift
+        scale = (self.gamma * std_inv).astype(x.dtype)
+        shift = (self.beta - mean * scale).astype(x.dtype)
+        out = np.multiply(x, self._broadcast(x, scale), out=self._buffer_like("activation", x, predict))
+        out += self._broadcast(x, shift)
         return out
 
     def _derivative(self, y, delta=None):
-        n, d = self.x_cache.shape
-        dx_normalized = delta * self.gamma
-        x_mu = self.x_cache - self.sample_mean
-        sample_std_inv = 1.0 / np.sqrt(self.sample_var + self._eps)
-        ds_var = -0.5 * np.sum(dx_normalized * x_mu, axis=0, keepdims=True) * sample_std_inv ** 3
-        ds_mean = (-1.0 * np.sum(dx_normalized * sample_std_inv, axis=0, keepdims=True) - 2.0 *
-                   ds_var * np.mean(x_mu, axis=0, keepdims=True))
-        dx1 = dx_normalized * sample_std_inv
-        dx2 = 2.0 / n * ds_var * x_mu
-        dx = dx1 + dx2 + 1.0 / n * ds_mean
-        dg = -np.sum(delta * self.x_normalized_cache, axis=0)
-        db = -np.sum(delta, axis=0)
-        self.gamma += self._g_optimizer.run(0, dg)
-        self.beta += self._b_optimizer.run(0, db)
-        self._g_optimizer.update(); self._b_optimizer.update()
-        return delta - dx
+        """
+        Computes gradients of x, gamma & beta in a single backward pass, gradients of gamma & beta are
+        stored in 'd_gamma' & 'd_beta' and applied by the optimizers of the network
+        """
+        x, mean, std_inv = self.x_cache, self.sample_mean, self.sample_std_inv
+        n = x.size // x.shape[1]
+        _sum = np.sum(delta, axis=self._get_axes(delta), dtype=np.float64)
+        _sum_normalized = (self._get_sum_of_products(delta, x) - mean * _sum) * std_inv
+        self.d_gamma, self.d_beta = _sum_normalized.astype(self.gamma.dtype), _sum.astype(self.beta.dtype)
+        # dx = gamma * std_inv * (delta - mean(delta) - x_normalized * mean(delta * x_normalized))
+        #    = delta * a + x * b + c
+        a = self.gamma * std_inv
+        b = -a * std_inv * _sum_normalized / n
+        c = -a * _sum / n - b * mean
+        dx = np.multiply(delta, self._broadcast(x, a.astype(x.dtype)), out=self._buffer_like("derivative", delta))
+        dx += np.multiply(x, self._broadcast(x, b.astype(x.dtype)), out=self._buffer_like("x_b", x))
+        dx += self._broadcast(x, c.astype(x.dtype))
+        return dx
 
 
 class ConvDrop(ConvLayer, Dropout, metaclass=ConvSubLayerMeta):
@@ -703,12 +961,20 @@ class CostLayer(SubLayer):
         raise LayerError("derivative function should not be called in CostLayer")
 
     def bp_first(self, y, y_pred):
+        if self.parent is not self._root:
+            return -self._cost_function(y, y_pred)
         if self._root.name == "Sigmoid" and self.cost_function == "Cross Entropy":
             return y * (1 - y_pred) - (1 - y) * y_pred
         if self._root.name == "Softmax" and  self.cost_function == "Log Likelihood":
             return -self._cost_function(y, y_pred) / 4
         return -self._cost_function(y, y_pred) * self._root.derivative(y_pred)
 
+    def transform(self, y_pred, out=None):
+        """
+        Map outputs of the network to predictions, outputs are predictions already for common CostLayers
+        """
+        return y_pred
+
     @property
     def calculate(self):
         return lambda y, y_pred: self._cost_function(y, y_pred, False)
@@ -756,7 +1022,8 @@ class CostLayer(SubLayer):
         return dx
 
     @staticmethod
-    def _cross_entropy(y, y_pred, diff=True):
+    def _cross_entropy(y, y_pred, diff=True, eps=1e-8):
+        y_pred = np.clip(y_pred, eps, 1 - eps)
         if diff:
             return -y / y_pred + (1 - y) / (1 - y_pred)
         assert_string = "y or y_pred should be np.ndarray in cost function"
@@ -765,7 +1032,7 @@ class CostLayer(SubLayer):
 
     @classmethod
     def _log_likelihood(cls, y, y_pred, diff=True, eps=1e-8):
-        if cls._batch_range is None:
+        if cls._batch_range is None or len(cls._batch_range) != len(y_pred):
             cls._batch_range = np.arange(len(y_pred))
         y_arg_max = np.argmax(y, axis=1)
         if diff:
@@ -777,7 +1044,74 @@ class CostLayer(SubLayer):
     def __str__(self):
         return self._cost_function_name
 
-    
+
+# Fused Cost Layers
+
+class FusedCostLayer(CostLayer):
+    """
+    CostLayers which take logits as input (so their root should be an 'Identical' Layer) and output logits.
+    Loss and gradient are both computed from logits, so confident predictions will not overflow or produce NaNs,
+    and 'transform' should be used to map logits to probabilities
+    """
+
+    fused_cost_function = None
+
+    def __init__(self, parent, shape):
+        CostLayer.__init__(self, parent, shape)
+        self._available_cost_functions = {self.fused_cost_function: self._fused_cost}
+        self.cost_function = self.fused_cost_function
+
+    @property
+    def params(self):
+        return ()
+
+    def bp_first(self, y, y_pred):
+        delta = self.transform(y_pred, out=self._buffer_like("delta", y_pred))
+        return np.subtract(y, delta, out=delta)
+
+    def transform(self, y_pred, out=None):
+        raise NotImplementedError("Please implement transform function for " + self.name)
+
+    def _loss(self, y, y_pred):
+        raise NotImplementedError("Please implement loss function for " + self.name)
+
+    def _fused_cost(self, y, y_pred, diff=True):
+        if diff:
+            return -self.bp_first(y, y_pred)
+        return self._loss(y, y_pred)
+
+
+class SoftmaxLogLikelihood(FusedCostLayer):
+
+    fused_cost_function = "Softmax Log Likelihood"
+
+    def transform(self, y_pred, out=None):
+        _rs = Layer.safe_exp(y_pred, out=out)
+        _rs /= np.sum(_rs, axis=1, keepdims=True)
+        return _rs
+
+    def _loss(self, y, y_pred):
+        _max = np.max(y_pred, axis=1, keepdims=True)
+        _log_sum_exp = np.log(np.sum(np.exp(y_pred - _max), axis=1, keepdims=True)) + _max
+        return np.sum(y * (_log_sum_exp - y_pred)) / len(y)
+
+
+class SigmoidCrossEntropy(FusedCostLayer):
+
+    fused_cost_function = "Sigmoid Cross Entropy"
+
+    def transform(self, y_pred, out=None):
+        # sigmoid(x) = (1 + tanh(x / 2)) / 2, which never overflows
+        _rs = np.multiply(y_pred, 0.5, out=out)
+        np.tanh(_rs, out=_rs)
+        _rs += 1
+        _rs *= 0.5
+        return _rs
+
+    def _loss(self, y, y_pred):
+        return np.average(np.maximum(y_pred, 0) - y * y_pred + np.log1p(np.exp(-np.abs(y_pred))))
+
+
 # Factory
 
 class LayerFactory:
@@ -785,17 +1119,20 @@ class LayerFactory:
     available_root_layers = {
         "Tanh": Tanh, "Sigmoid": Sigmoid,
         "ELU": ELU, "ReLU": ReLU, "Softplus": Softplus,
+        "LeakyReLU": LeakyReLU, "SELU": SELU, "Swish": Swish, "GELU": GELU,
         "Softmax": Softmax,
         "Identical": Identical,
         "ConvTanh": ConvTanh, "ConvSigmoid": ConvSigmoid,
         "ConvELU": ConvELU, "ConvReLU": ConvReLU, "ConvSoftplus": ConvSoftplus,
+        "ConvLeakyReLU": ConvLeakyReLU, "ConvSELU": ConvSELU, "ConvSwish": ConvSwish, "ConvGELU": ConvGELU,
         "ConvSoftmax": ConvSoftmax,
         "ConvIdentical": ConvIdentical,
-        "MaxPool": MaxPool
+        "MaxPool": MaxPool, "AvgPool": AvgPool
     }
     available_sub_layers = {
         "Dropout", "Normalize", "ConvNorm", "ConvDrop",
-        "MSE", "NaiveSVM", "Cross Entropy", "Log Likelihood"
+        "MSE", "NaiveSVM", "Cross Entropy", "Log Likelihood",
+        "Softmax Log Likelihood", "Sigmoid Cross Entropy"
     }
     available_cost_functions = {
         "MSE", "NaiveSVM", "Cross Entropy", "Log Likelihood"
@@ -804,13 +1141,17 @@ class LayerFactory:
         "Dropout": Dropout,
         "Normalize": Normalize,
         "ConvDrop": ConvDrop,
-        "ConvNorm": ConvNorm
+        "ConvNorm": ConvNorm,
+        "Softmax Log Likelihood": SoftmaxLogLikelihood,
+        "Sigmoid Cross Entropy": SigmoidCrossEntropy
     }
     special_layer_default_params = {
         "Dropout": (0.5, ),
-        "Normalize": (0.01, 1e-8, 0.9),
+        "Normalize": (1e-8, 0.9),
         "ConvDrop": (0.5, ),
-        "ConvNorm": (0.001, 1e-8, 0.9)
+        "ConvNorm": (1e-8, 0.9),
+        "Softmax Log Likelihood": (),
+        "Sigmoid Cross Entropy": ()
     }
 
     def handle_str_main_layers(self, name, *args, **kwargs):
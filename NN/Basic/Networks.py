@@ -29,6 +29,7 @@ class NNVerbose:
 class NNConfig:
     BOOST_LESS_SAMPLES = False
     TRAINING_SCALE = 5 / 6
+    DTYPE = np.float64
 
 
 # Neural Network
@@ -41,6 +42,8 @@ class NNDist:
         self._layer_names, self._layer_shapes, self._layer_params = [], [], []
         self._lr, self._epoch, self._regularization_param = 0, 0, 0
         self._w_optimizer, self._b_optimizer, self._optimizer_name = None, None, ""
+        self._dtype = NNConfig.DTYPE
+        self._workspace = Workspace()
         self.verbose = 0
 
         self._whether_apply_bias = False
@@ -88,6 +91,7 @@ class NNDist:
         self._layer_names, self._layer_shapes, self._layer_params = [], [], []
         self._lr, self._epoch, self._regularization_param = 0, 0, 0
         self._w_optimizer, self._b_optimizer, self._optimizer_name = None, None, ""
+        self._workspace.clear()
 
         self._whether_apply_bias = False
         self._current_dimension = 0
@@ -151,6 +155,24 @@ class NNDist:
             if sp_param is not None:
                 layer.set_special_params(sp_param)
 
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, value):
+        self._dtype = np.dtype(value).type
+        self._weights = [None if w is None else w.astype(self._dtype) for w in self._weights]
+        self._bias = [None if b is None else b.astype(self._dtype) for b in self._bias]
+        for layer in self._layers:
+            if isinstance(layer, Normalize):
+                layer.gamma, layer.beta = layer.gamma.astype(self._dtype), layer.beta.astype(self._dtype)
+        _weights, _bias = self._get_variables()
+        if isinstance(self._w_optimizer, Optimizers):
+            self._w_optimizer.feed_variables(_weights)
+        if isinstance(self._b_optimizer, Optimizers):
+            self._b_optimizer.feed_variables(_bias)
+
     @property
     def optimizer(self):
         return self._optimizer_name
@@ -178,6 +200,7 @@ class NNDist:
             raise BuildNetworkError("Data fed to network should be identical in length, x: {} and y: {} found".format(
                 len(x), len(y)
             ))
+        x, y = np.asarray(x, dtype=self._dtype), np.asarray(y, dtype=self._dtype)
         self._x, self._y = x, y
         self._x_min, self._x_max = np.min(x), np.max(x)
         self._y_min, self._y_max = np.min(y), np.max(y)
@@ -186,17 +209,19 @@ class NNDist:
     @NNTiming.timeit(level=4)
     def _add_weight(self, shape, conv_channel=None, fc_shape=None):
         if fc_shape is not None:
-            self._weights.append(np.random.randn(fc_shape, shape[1]))
-            self._bias.append(np.zeros((1, shape[1])))
+            self._weights.append(np.random.randn(fc_shape, shape[1]).astype(self._dtype))
+            self._bias.append(np.zeros((1, shape[1]), dtype=self._dtype))
         elif conv_channel is not None:
             if len(shape[1]) <= 2:
-                self._weights.append(np.random.randn(conv_channel, conv_channel, shape[1][0], shape[1][1]))
+                self._weights.append(np.random.randn(
+                    conv_channel, conv_channel, shape[1][0], shape[1][1]).astype(self._dtype))
             else:
-                self._weights.append(np.random.randn(shape[1][0], conv_channel, shape[1][1], shape[1][2]))
-            self._bias.append(np.zeros((1, shape[1][0])))
+                self._weights.append(np.random.randn(
+                    shape[1][0], conv_channel, shape[1][1], shape[1][2]).astype(self._dtype))
+            self._bias.append(np.zeros((1, shape[1][0]), dtype=self._dtype))
         else:
-            self._weights.append(np.random.randn(*shape))
-            self._bias.append(np.zeros((1, shape[1])))
+            self._weights.append(np.random.randn(*shape).astype(self._dtype))
+            self._bias.append(np.zeros((1, shape[1]), dtype=self._dtype))
 
     @NNTiming.timeit(level=4)
     def _add_layer(self, layer, *args, **kwargs):
@@ -220,20 +245,21 @@ class NNDist:
             if not isinstance(layer, CostLayer) and _current != _parent.shape[1]:
                 raise BuildLayerError("Output shape should be identical with input shape "
                                       "if chosen SubLayer is not a CostLayer")
+            if isinstance(layer, FusedCostLayer) and not isinstance(layer.root, Identical):
+                raise BuildLayerError("{} should be stacked upon an Identical Layer which outputs logits, "
+                                      "{} found".format(layer.name, layer.root.name))
             _parent.child = layer
             layer.is_sub_layer = True
+            if isinstance(layer, Normalize):
+                layer.gamma, layer.beta = layer.gamma.astype(self._dtype), layer.beta.astype(self._dtype)
             layer.root = layer.root
             layer.root.last_sub_layer = layer
             if isinstance(layer, CostLayer):
                 layer.root.is_last_root = True
             self.parent = _parent
             self._layers.append(layer)
-            if not isinstance(layer, ConvLayer):
-                self._weights.append(np.eye(_current))
-                self._bias.append(np.zeros((1, _current)))
-            else:
-                self._weights.append(np.array([.0]))
-                self._bias.append(np.array([.0]))
+            self._weights.append(None)
+            self._bias.append(None)
             self._current_dimension = _next
         else:
             fc_shape, conv_channel, last_layer = None, None, self._layers[-1]
@@ -270,10 +296,16 @@ class NNDist:
     def _update_layer_information(self, layer):
         self._layer_params.append(layer.params)
 
+    @NNTiming.timeit(level=4)
+    def _get_visual_weights(self):
+        return [np.eye(layer.shape[0]) if weight is None else weight
+                for layer, weight in zip(self._layers, self._weights)]
+
     @NNTiming.timeit(level=1)
     def _get_prediction(self, x, name=None, batch_size=1e6, verbose=None):
         if verbose is None:
             verbose = self.verbose
+        x = np.asarray(x, dtype=self._dtype)
         single_batch = int(batch_size / np.prod(x.shape[1:]))
         if not single_batch:
             single_batch = 1
@@ -350,7 +382,7 @@ class NNDist:
                  for i, divide in enumerate(axis1_divide)]
 
         colors, thicknesses = [], []
-        color_weights = [weight.copy() for weight in self._weights]
+        color_weights = [weight.copy() for weight in self._get_visual_weights()]
         color_min = [np.min(weight) for weight in color_weights]
         color_max = [np.max(weight) for weight in color_weights]
         color_average = [np.average(weight) for weight in color_weights] if weight_average is None else weight_average
@@ -439,7 +471,7 @@ class NNDist:
         axis1 = [axis[1:-1] for axis in axis1]
 
         colors, thicknesses = [], []
-        color_weights = [weight.copy() for weight in self._weights]
+        color_weights = [weight.copy() for weight in self._get_visual_weights()]
         color_min = [np.min(weight) for weight in color_weights]
         color_max = [np.max(weight) for weight in color_weights]
         color_average = [np.average(weight) for weight in color_weights] if weight_average is None else weight_average
@@ -490,8 +522,9 @@ class NNDist:
         whether_sub_layers = np.array([isinstance(layer, SubLayer) for layer in self._layers])
         n_sub_layers = int(np.sum(whether_sub_layers))
 
-        _activations = [self._weights[0].copy().T]
-        for weight in self._weights[1:]:
+        _weights = self._get_visual_weights()
+        _activations = [_weights[0].copy().T]
+        for weight in _weights[1:]:
             _activations.append(weight.T.dot(_activations[-1]))
         _graphs = []
         for j, activation in enumerate(_activations):
@@ -520,7 +553,7 @@ class NNDist:
         axis1 = [axis[1:-1] for axis in axis1]
 
         colors, thicknesses = [], []
-        color_weights = [weight.copy() for weight in self._weights]
+        color_weights = [weight.copy() for weight in self._get_visual_weights()]
         color_min = [np.min(weight) for weight in color_weights]
         color_max = [np.max(weight) for weight in color_weights]
         color_average = [np.average(weight) for weight in color_weights] if weight_average is None else weight_average
@@ -574,14 +607,27 @@ class NNDist:
 
     # Optimizing Process
 
+    @NNTiming.timeit(level=4)
+    def _get_variables(self):
+        """
+        :return: trainable variables which are updated by the optimizers, gamma & beta of Normalize layers
+                 take the places of weights & bias respectively
+        """
+        _weights, _bias = self._weights[:], self._bias[:]
+        for i, layer in enumerate(self._layers):
+            if isinstance(layer, Normalize):
+                _weights[i], _bias[i] = layer.gamma, layer.beta
+        return _weights, _bias
+
     @NNTiming.timeit(level=4)
     def _init_optimizer(self):
+        _weights, _bias = self._get_variables()
         if not isinstance(self._w_optimizer, Optimizers):
             self._w_optimizer = self._optimizer_factory.get_optimizer_by_name(
-                self._w_optimizer, self._weights, self.NNTiming, self._lr, self._epoch)
+                self._w_optimizer, _weights, self.NNTiming, self._lr, self._epoch)
         if not isinstance(self._b_optimizer, Optimizers):
             self._b_optimizer = self._optimizer_factory.get_optimizer_by_name(
-                self._b_optimizer, self._bias, self.NNTiming, self._lr, self._epoch)
+                self._b_optimizer, _bias, self.NNTiming, self._lr, self._epoch)
         if self._w_optimizer.name != self._b_optimizer.name:
             self._optimizer_name = None
         else:
@@ -589,21 +635,28 @@ class NNDist:
 
     @NNTiming.timeit(level=1)
     def _opt(self, i, _activation, _delta):
-        if not isinstance(self._layers[i], ConvLayer):
+        if isinstance(self._layers[i], Normalize):
+            _layer = self._layers[i]
+            _layer.gamma += self._w_optimizer.run(i, _layer.d_gamma)
+            _layer.beta += self._b_optimizer.run(i, _layer.d_beta)
+        elif not isinstance(self._layers[i], ConvLayer):
+            _dtype = np.result_type(_activation, _delta)
             self._weights[i] *= self._regularization_param
-            self._weights[i] += self._w_optimizer.run(
-                i, _activation.reshape(_activation.shape[0], -1).T.dot(_delta)
-            )
+            self._weights[i] += self._w_optimizer.run(i, np.dot(
+                _activation.reshape(_activation.shape[0], -1).T, _delta,
+                out=self._workspace.get(("dw", i), self._weights[i].shape, _dtype)
+            ))
             if self._whether_apply_bias:
-                self._bias[i] += self._b_optimizer.run(
-                    i, np.sum(_delta, axis=0, keepdims=True)
-                )
+                self._bias[i] += self._b_optimizer.run(i, np.sum(
+                    _delta, axis=0, keepdims=True,
+                    out=self._workspace.get(("db", i), self._bias[i].shape, _delta.dtype)
+                ))
         else:
             self._weights[i] *= self._regularization_param
             if _delta[1] is not None:
                 self._weights[i] += self._w_optimizer.run(i, _delta[1])
             if self._whether_apply_bias and _delta[2] is not None:
-                self._bias[i] += self._b_optimizer.run(i, _delta[2])
+                self._bias[i] += self._b_optimizer.run(i, _delta[2].reshape(self._bias[i].shape))
 
     # API
 
@@ -756,7 +809,8 @@ class NNDist:
         x, y = self._feed_data(x, y)
         self._lr, self._epoch = lr, epoch
         for weight in self._weights:
-            weight *= weight_scale
+            if weight is not None:
+                weight *= weight_scale
         if not self._w_optimizer or not self._b_optimizer:
             if not self._optimizer_name:
                 if optimizer is None:
@@ -816,7 +870,7 @@ class NNDist:
             bar.start()
         img = None
 
-        weight_trace = [[[org] for org in weight] for weight in self._weights]
+        weight_trace = [[[org] for org in weight] if weight is not None else None for weight in self._weights]
         sub_bar = ProgressBar(min_value=0, max_value=train_repeat * record_period - 1, name="Iteration")
         for counter in range(epoch):
             self._w_optimizer.update(); self._b_optimizer.update()
@@ -827,14 +881,17 @@ class NNDist:
             for _i in range(train_repeat):
                 if do_random_batch:
                     batch = np.random.choice(train_len, batch_size)
-                    x_batch, y_batch = x_train[batch], y_train[batch]
+                    x_batch = np.take(x_train, batch, axis=0, out=self._workspace.get(
+                        "x_batch", (batch_size,) + x_train.shape[1:], x_train.dtype))
+                    y_batch = np.take(y_train, batch, axis=0, out=self._workspace.get(
+                        "y_batch", (batch_size,) + y_train.shape[1:], y_train.dtype))
                 else:
                     x_batch, y_batch = x_train, y_train
 
                 _activations = self._get_activations(x_batch)
                 if self.verbose >= NNVerbose.DEBUG:
                     _xs = [x_batch.dot(self._weights[0])]
-                    for i, weight in enumerate(self._weights[1:]):
+                    for i, weight in enumerate(self._get_visual_weights()[1:]):
                         _xs.append(_activations[i].dot(weight))
 
                 _deltas = [self._layers[-1].bp_first(y_batch, _activations[-1])]
@@ -842,12 +899,14 @@ class NNDist:
                     _deltas.append(self._layers[i - 1].bp(_activations[i - 1], self._weights[i], _deltas[-1]))
 
                 for i in range(layer_width - 1, 0, -1):
-                    if not isinstance(self._layers[i], SubLayer):
+                    if not isinstance(self._layers[i], SubLayer) or isinstance(self._layers[i], Normalize):
                         self._opt(i, _activations[i - 1], _deltas[layer_width - i - 1])
                 self._opt(0, x_batch, _deltas[-1])
 
                 if draw_weights:
                     for i, weight in enumerate(self._weights):
+                        if weight is None:
+                            continue
                         for j, new_weight in enumerate(weight.copy()):
                             weight_trace[i][j].append(new_weight)
                 if self.verbose >= NNVerbose.DEBUG:
@@ -907,6 +966,8 @@ class NNDist:
         if draw_weights:
             ts = np.arange(epoch * train_repeat + 1)
             for i, weight in enumerate(self._weights):
+                if weight is None:
+                    continue
                 plt.figure()
                 for j in range(len(weight)):
                     plt.plot(ts, weight_trace[i][j])
@@ -939,7 +1000,8 @@ class NNDist:
                     "_layer_names": self.layer_names,
                     "_layer_params": self._layer_params,
                     "_cost_layer": self._layers[-1].name,
-                    "_next_dimension": self._current_dimension
+                    "_next_dimension": self._current_dimension,
+                    "_dtype": self._dtype
                 },
                 "params": {
                     "_logs": self._logs,
@@ -980,7 +1042,8 @@ class NNDist:
         x = np.array(x)
         if len(x.shape) == 1:
             x = x.reshape(1, -1)
-        return self._get_prediction(x)
+        y_pred = self._get_prediction(x)
+        return self._layers[-1].transform(y_pred, out=y_pred)
 
     @NNTiming.timeit(level=4, prefix="[API] ")
     def predict_classes(self, x, flatten=True):
@@ -1072,6 +1135,8 @@ class NNDist:
 
     def draw_conv_weights(self):
         for i, (name, weight) in enumerate(zip(self.layer_names, self._weights)):
+            if weight is None:
+                continue
             if len(weight.shape) != 4:
                 return
             for j, _w in enumerate(weight):
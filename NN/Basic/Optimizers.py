@@ -1,6 +1,8 @@
 import numpy as np
 from abc import ABCMeta, abstractmethod
 
+from NN.Basic.Workspace import Workspace
+
 from Util.Timing import Timing
 
 
@@ -11,6 +13,16 @@ class Optimizers(metaclass=ABCMeta):
     def __init__(self, lr=0.01, cache=None):
         self.lr = lr
         self._cache = cache
+        self._workspace = Workspace()
+
+    def __getstate__(self):
+        _state = self.__dict__.copy()
+        _state.pop("_workspace", None)
+        return _state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._workspace = Workspace()
 
     def __str__(self):
         return self.__class__.__name__
@@ -24,7 +36,7 @@ class Optimizers(metaclass=ABCMeta):
 
     def feed_variables(self, variables):
         self._cache = [
-            np.zeros(var.shape) for var in variables
+            None if var is None else np.zeros_like(var) for var in variables
         ]
 
     def feed_timing(self, timing):
@@ -33,6 +45,11 @@ class Optimizers(metaclass=ABCMeta):
 
     @OptTiming.timeit(level=1, prefix="[API] ")
     def run(self, i, dw):
+        """
+        :param i:  index of the variable
+        :param dw: gradient of the variable, will be used as scratch memory and overwritten
+        :return:   step which should be added to the variable
+        """
         return self._run(i, dw)
 
     @abstractmethod
@@ -51,7 +68,8 @@ class Optimizers(metaclass=ABCMeta):
 class MBGD(Optimizers):
 
     def _run(self, i, dw):
-        return self.lr * dw
+        dw *= self.lr
+        return dw
 
     def _update(self):
         pass
@@ -96,9 +114,11 @@ class Momentum(Optimizers):
         self.update_step()
 
     def _run(self, i, dw):
-        velocity = self._cache
-        velocity[i] = velocity[i] * self._momentum + self.lr * dw
-        return velocity[i]
+        velocity = self._cache[i]
+        velocity *= self._momentum
+        dw *= self.lr
+        velocity += dw
+        return velocity
 
     def _update(self):
         if self._momentum < self._ceiling:
@@ -109,9 +129,11 @@ class NAG(Momentum):
 
     def _run(self, i, dw):
         dw *= self.lr
-        velocity = self._cache
-        velocity[i] = self._momentum * velocity[i] + dw
-        return self._momentum * velocity[i] + dw
+        velocity = self._cache[i]
+        velocity *= self._momentum
+        velocity += dw
+        dw += np.multiply(velocity, self._momentum, out=self._workspace.like(i, velocity))
+        return dw
 
 
 class Adam(Optimizers):
@@ -122,14 +144,23 @@ class Adam(Optimizers):
 
     def feed_variables(self, variables):
         self._cache = [
-            [np.zeros(var.shape) for var in variables],
-            [np.zeros(var.shape) for var in variables],
+            [None if var is None else np.zeros_like(var) for var in variables],
+            [None if var is None else np.zeros_like(var) for var in variables],
         ]
 
     def _run(self, i, dw):
-        self._cache[0][i] = self._cache[0][i] * self.beta1 + (1 - self.beta1) * dw
-        self._cache[1][i] = self._cache[1][i] * self.beta2 + (1 - self.beta2) * (dw ** 2)
-        return self.lr * self._cache[0][i] / (np.sqrt(self._cache[1][i] + self.eps))
+        m, v, _tmp = self._cache[0][i], self._cache[1][i], self._workspace.like(i, dw)
+        m *= self.beta1
+        m += np.multiply(dw, 1 - self.beta1, out=_tmp)
+        v *= self.beta2
+        _tmp = np.square(dw, out=_tmp)
+        _tmp *= 1 - self.beta2
+        v += _tmp
+        _tmp = np.add(v, self.eps, out=_tmp)
+        np.sqrt(_tmp, out=_tmp)
+        dw = np.multiply(m, self.lr, out=dw)
+        dw /= _tmp
+        return dw
 
     def _update(self):
         pass
@@ -142,8 +173,16 @@ class RMSProp(Optimizers):
         self.decay_rate, self.eps = decay_rate, eps
 
     def _run(self, i, dw):
-        self._cache[i] = self._cache[i] * self.decay_rate + (1 - self.decay_rate) * dw ** 2
-        return self.lr * dw / (np.sqrt(self._cache[i] + self.eps))
+        cache, _tmp = self._cache[i], self._workspace.like(i, dw)
+        cache *= self.decay_rate
+        _tmp = np.square(dw, out=_tmp)
+        _tmp *= 1 - self.decay_rate
+        cache += _tmp
+        _tmp = np.add(cache, self.eps, out=_tmp)
+        np.sqrt(_tmp, out=_tmp)
+        dw *= self.lr
+        dw /= _tmp
+        return dw
 
     def _update(self):
         pass
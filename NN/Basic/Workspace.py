@@ -0,0 +1,38 @@
+import numpy as np
+
+
+class Workspace:
+    """
+    Scratch buffers keyed by name. A buffer is allocated the first time a key is requested
+    and reused afterwards, so it is only re-allocated when the requested shape or dtype changes
+    (e.g. when the batch size changes)
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def __contains__(self, key):
+        return key in self._buffers
+
+    @property
+    def nbytes(self):
+        return sum(_buffer.nbytes for _buffer in self._buffers.values())
+
+    def get(self, key, shape, dtype=np.float64, init=np.empty):
+        """
+        :param init: allocator of new buffers, e.g. np.zeros if untouched parts of the buffer should be zeros
+        """
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        _buffer = self._buffers.get(key)
+        if _buffer is None or _buffer.shape != shape or _buffer.dtype != dtype:
+            _buffer = self._buffers[key] = init(shape, dtype)
+        return _buffer
+
+    def like(self, key, arr):
+        return self.get(key, arr.shape, arr.dtype)
+
+    def clear(self):
+        self._buffers = {}
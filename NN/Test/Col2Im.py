@@ -0,0 +1,51 @@
+import time
+
+from NN.Basic.Layers import *
+
+np.random.seed(142857)  # for reproducibility
+
+
+def col2im_6d_naive(cols, n, n_channels, height, width, filter_height, filter_width, pad, stride):
+    _, _, _, _, out_h, out_w = cols.shape
+    x_padded = np.zeros((n, n_channels, height + 2 * pad, width + 2 * pad), dtype=cols.dtype)
+    for i in range(n):
+        for j in range(out_h):
+            for k in range(out_w):
+                x_padded[:, :, j * stride:j * stride + filter_height, k * stride:k * stride + filter_width][i] += (
+                    cols[..., i, j, k])
+    if pad > 0:
+        return x_padded[:, :, pad:-pad, pad:-pad]
+    return x_padded
+
+
+def main():
+    try:
+        from NN.Basic.CFunc.core import col2im_6d_cython
+    except ImportError:
+        col2im_6d_cython = None
+    methods = [("naive", col2im_6d_naive), ("numpy", col2im_6d_numpy)]
+    if col2im_6d_cython is not None:
+        methods.append(("cython", col2im_6d_cython))
+
+    for n, n_channels, size, filter_size, pad, stride in [
+        (64, 32, 32, 3, 1, 1), (64, 64, 16, 3, 1, 1), (64, 32, 31, 3, 0, 2), (64, 128, 8, 1, 0, 1)
+    ]:
+        out_size = (size + 2 * pad - filter_size) // stride + 1
+        cols = np.random.randn(n_channels, filter_size, filter_size, n, out_size, out_size)
+        args = (n, n_channels, size, size, filter_size, filter_size, pad, stride)
+        print("=" * 30)
+        print("n: {}  c: {}  size: {}  filter: {}  pad: {}  stride: {}".format(
+            n, n_channels, size, filter_size, pad, stride))
+        print("-" * 30)
+        rs = None
+        for name, method in methods:
+            _t = time.time()
+            _rs = method(cols, *args)
+            _t = time.time() - _t
+            if rs is None:
+                rs = _rs
+            print("{:<8s}: {:12.6} s  (match: {})".format(name, _t, np.allclose(rs, _rs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import time
+import pickle
+
+from NN.Basic.Networks import *
+
+np.random.seed(142857)  # for reproducibility
+
+
+def build(x, y):
+    nn = NNDist()
+    nn.add("ConvReLU", (x.shape[1:], (32, 3, 3)), 1, 1)
+    nn.add("ConvReLU", ((32, 3, 3),), 1, 1)
+    nn.add("MaxPool", ((2, 2),), 2)
+    nn.add("ConvNorm")
+    nn.add("ConvDrop")
+    nn.add("ConvReLU", ((64, 3, 3),), 1, 1)
+    nn.add("ConvReLU", ((64, 3, 3),), 1, 1)
+    nn.add("AvgPool", ((2, 2),), 2)
+    nn.add("ConvNorm")
+    nn.add("ConvDrop")
+    nn.add("ConvReLU", ((32, 1, 1),))
+    nn.add("ConvReLU", ((32, 3, 3),), 1, 1)
+    nn.add("AvgPool", ((2, 2),), 2)
+    nn.add("ReLU", (512, ))
+    nn.add("ReLU", (64, ))
+    nn.add("Normalize")
+    nn.add("Dropout")
+    nn.add("Identical", (y.shape[1], ))
+    nn.add("Softmax Log Likelihood")
+    for weight in nn["weights"]:
+        if weight is not None:
+            weight *= 0.01
+    return nn
+
+
+def profile(nn, x, y, epoch=5):
+    layers, weights, bias = nn["layers"], nn["weights"], nn["bias"]
+    forward, backward = np.zeros(len(layers)), np.zeros(len(layers))
+    for counter in range(epoch + 1):
+        # The first round is a warm up round, which allocates the workspaces
+        if counter == 1:
+            forward[:], backward[:] = 0, 0
+        activations, _input = [], x
+        for i, layer in enumerate(layers):
+            _t = time.time()
+            _input = layer.activate(_input, weights[i], bias[i])
+            forward[i] += time.time() - _t
+            activations.append(_input)
+        _t = time.time()
+        deltas = [layers[-1].bp_first(y, activations[-1])]
+        backward[-1] += time.time() - _t
+        for i in range(-1, -len(activations), -1):
+            _t = time.time()
+            deltas.append(layers[i - 1].bp(activations[i - 1], weights[i], deltas[-1]))
+            backward[i - 1] += time.time() - _t
+    return forward / epoch, backward / epoch
+
+
+def main():
+    with open("../Data/mini_cifar10.dat", "rb") as file:
+        x, y = pickle.load(file)
+    x, y = x[:64], y[:64]
+
+    nn = build(x, y)
+    forward, backward = profile(nn, x, y)
+
+    print("=" * 64)
+    print("{:>4s}  {:<24s}  {:>14s}  {:>14s}".format("", "Layer", "Forward (ms)", "Backward (ms)"))
+    print("-" * 64)
+    for i, layer in enumerate(nn["layers"]):
+        print("{:>4d}  {:<24s}  {:14.4f}  {:14.4f}".format(i + 1, layer.name, forward[i] * 1000, backward[i] * 1000))
+    print("-" * 64)
+    print("{:>4s}  {:<24s}  {:14.4f}  {:14.4f}".format("", "Total", forward.sum() * 1000, backward.sum() * 1000))
+    print("=" * 64)
+
+
+if __name__ == '__main__':
+    main()
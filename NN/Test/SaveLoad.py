@@ -0,0 +1,55 @@
+import os
+import pickle
+import tempfile
+
+from NN.Basic.Networks import *
+from Util.Util import DataUtil
+
+np.random.seed(142857)  # for reproducibility
+
+
+def build_dense(x, y):
+    nn = NNDist()
+    nn.add("ReLU", (x.shape[1], 32))
+    nn.add("Normalize")
+    nn.add("Dropout")
+    nn.add("Softmax", (y.shape[1], ))
+    return nn
+
+
+def build_conv(x, y):
+    nn = NNDist()
+    nn.add("ConvReLU", (x.shape[1:], (8, 3, 3)), 1, 1)
+    nn.add("ConvNorm")
+    nn.add("ConvDrop")
+    nn.add("MaxPool", ((2, 2),), 2)
+    nn.add("ConvNorm")
+    nn.add("ConvReLU", ((8, 3, 3),), 1, 1)
+    nn.add("ReLU", (32, ))
+    nn.add("Normalize")
+    nn.add("Softmax", (y.shape[1], ))
+    return nn
+
+
+def round_trip(name, nn, x, y, **kwargs):
+    nn.fit(x, y, verbose=0, do_log=False, **kwargs)
+    _dir = tempfile.mkdtemp()
+    nn.save(_dir, "Model.nn")
+    loaded = NNDist()
+    loaded.load(os.path.join(_dir, "Model.nn"))
+    print("{:<6s}: {}  (match: {})".format(name, loaded.layer_names, np.allclose(nn.predict(x), loaded.predict(x))))
+    loaded.fit(x, y, epoch=1, verbose=0, do_log=False)
+
+
+def main():
+    x, y = DataUtil.gen_spin(size=100, n=4, n_class=2)
+    round_trip("dense", build_dense(x, y), x, y, epoch=5)
+
+    with open("../Data/mini_mnist.dat", "rb") as file:
+        x, y = pickle.load(file)
+    x, y = x[:64].reshape(64, 1, 28, 28), y[:64]
+    round_trip("conv", build_conv(x, y), x, y, epoch=1, batch_size=32, weight_scale=0.1)
+
+
+if __name__ == '__main__':
+    main()
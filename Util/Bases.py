@@ -38,6 +38,9 @@ class ClassifierBase:
     def predict(self, x, get_raw_results=False):
         pass
 
+    def strip(self):
+        return self
+
     def estimate(self, x, y, metrics=None, tar=None, prefix="Acc"):
         pass
 
@@ -164,6 +167,13 @@ class KernelBase(ClassifierBase, metaclass=ClassifierMeta):
                 _logs.append(_local_logs)
         return _logs
 
+    def strip(self):
+        _mask = self._w != 0
+        self._x, self._w = self._x[_mask], self._w[_mask]
+        self._y = self._gram = self._alpha = None
+        self._prediction_cache = self._dw_cache = self._db_cache = None
+        return self
+
     @KernelBaseTiming.timeit(level=1, prefix="[API] ")
     def predict(self, x, get_raw_results=False, provide_gram=False):
         if not provide_gram:
@@ -61,6 +61,11 @@ class NaiveBayes(ClassifierBase, metaclass=ClassifierMeta):
     def _fit(self, lb):
         pass
 
+    def strip(self):
+        self._x = self._y = None
+        self._labelled_x = self._label_zip = self._con_counter = None
+        return self
+
     @NaiveBayesTiming.timeit(level=1, prefix="[API] ")
     def predict(self, x, get_raw_result=False):
         if isinstance(x, np.ndarray):
@@ -74,6 +74,12 @@ class MergedNB(NaiveBayes, metaclass=SubClassChangeNamesMeta):
 
         return func
 
+    def strip(self):
+        NaiveBayes.strip(self)
+        self._multinomial.strip()
+        self._gaussian.strip()
+        return self
+
     @MergedNBTiming.timeit(level=1, prefix="[Core] ")
     def _transfer_x(self, x):
         _feat_dics = self._multinomial["feat_dics"]
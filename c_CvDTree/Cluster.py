@@ -1,5 +1,47 @@
-import math
 import numpy as np
+from math import log
+
+
+class Impurity:
+    _nlogn_table = np.zeros(1)
+
+    @staticmethod
+    def nlogn(counts):
+        counts = np.asarray(counts)
+        if counts.dtype.kind in "iub":
+            _max = int(counts.max()) if counts.size else 0
+            if _max >= len(Impurity._nlogn_table):
+                _n = np.arange(max(_max + 1, 2 * len(Impurity._nlogn_table)), dtype=np.float64)
+                _n[0] = 1
+                Impurity._nlogn_table = _n * np.log(_n)
+            return Impurity._nlogn_table[counts]
+        _rs = np.zeros(counts.shape)
+        _mask = counts > 0
+        _rs[_mask] = counts[_mask] * np.log(counts[_mask])
+        return _rs
+
+    @staticmethod
+    def ent(counts, base=2, eps=1e-12):
+        counts = np.asarray(counts)
+        _totals = counts.sum(axis=-1)
+        _ent = Impurity.nlogn(_totals) - Impurity.nlogn(counts).sum(axis=-1)
+        _ent /= np.where(_totals > 0, _totals, 1) * log(base)
+        return np.maximum(_ent, eps)
+
+    @staticmethod
+    def gini(counts):
+        counts = np.asarray(counts, dtype=np.float64)
+        _totals = counts.sum(axis=-1)
+        _totals = np.where(_totals > 0, _totals, np.inf)
+        return 1 - np.sum(counts ** 2, axis=-1) / _totals ** 2
+
+    @staticmethod
+    def chaos(counts, criterion="ent", base=2):
+        if criterion == "ent":
+            return Impurity.ent(counts, base)
+        if criterion == "gini":
+            return Impurity.gini(counts)
+        raise NotImplementedError("Conditional info criterion '{}' not defined".format(criterion))
 
 
 class Cluster:
@@ -15,101 +57,153 @@ class Cluster:
         self._base = base
 
     def ent(self, ent=None, eps=1e-12):
-        if self._ent_cache is not None and ent is None:
-            return self._ent_cache
-        _len = len(self._y)
-        if ent is None:
-            ent = self._counters
-        _ent_cache = max(eps, -sum(
-            [_c / _len * math.log(_c / _len, self._base) if _c != 0 else 0 for _c in ent]))
-        if ent is None:
-            self._ent_cache = _ent_cache
-        return _ent_cache
+        if ent is not None:
+            return float(Impurity.ent(ent, self._base, eps))
+        if self._ent_cache is None:
+            self._ent_cache = float(Impurity.ent(self._counters, self._base, eps))
+        return self._ent_cache
 
     def gini(self, p=None):
-        if self._gini_cache is not None and p is None:
-            return self._gini_cache
-        if p is None:
-            p = self._counters
-        _gini_cache = 1 - np.sum((p / len(self._y)) ** 2)
-        if p is None:
-            self._gini_cache = _gini_cache
-        return _gini_cache
+        if p is not None:
+            return float(Impurity.gini(p))
+        if self._gini_cache is None:
+            self._gini_cache = float(Impurity.gini(self._counters))
+        return self._gini_cache
 
-    def con_chaos(self, idx, criterion="ent", features=None):
-        if criterion == "ent":
-            _method = lambda cluster: cluster.ent()
-        elif criterion == "gini":
-            _method = lambda cluster: cluster.gini()
+    # Split counting
+
+    def _value_counts(self, data, values):
+        _n_class = len(self._counters)
+        _values, _inverse = np.unique(data, return_inverse=True)
+        _codes = _inverse.ravel() * _n_class + self._y
+        _size = len(_values) * _n_class
+        counts = np.bincount(_codes, minlength=_size).reshape(-1, _n_class)
+        if self._sample_weight is None:
+            w_counts = None
         else:
-            raise NotImplementedError("Conditional info criterion '{}' not defined".format(criterion))
-        data = self._x[idx]
-        if features is None:
-            features = set(data)
-        tmp_labels = [data == feature for feature in features]
-        # noinspection PyTypeChecker
-        self._con_chaos_cache = [np.sum(_label) for _label in tmp_labels]
-        label_lst = [self._y[label] for label in tmp_labels]
-        rs, chaos_lst = 0, []
-        for data_label, tar_label in zip(tmp_labels, label_lst):
-            tmp_data = self._x.T[data_label]
-            if self._sample_weight is None:
-                _chaos = _method(Cluster(tmp_data, tar_label, base=self._base))
-            else:
-                _new_weights = self._sample_weight[data_label]
-                _chaos = _method(Cluster(tmp_data, tar_label, _new_weights / np.sum(_new_weights), base=self._base))
-            rs += len(tmp_data) / len(data) * _chaos
-            chaos_lst.append(_chaos)
-        return rs, chaos_lst
+            w_counts = np.bincount(_codes, self._sample_weight, minlength=_size).reshape(-1, _n_class)
+        _pos = {value: i for i, value in enumerate(_values.tolist())}
+        _rows = np.array([_pos.get(value, -1) for value in values], dtype=np.int64)
+        _missing = _rows < 0
+        counts = counts[_rows]
+        counts[_missing] = 0
+        if w_counts is not None:
+            w_counts = w_counts[_rows]
+            w_counts[_missing] = 0
+        return counts, w_counts
 
-    def info_gain(self, idx, criterion="ent", get_chaos_lst=False, features=None):
+    def _threshold_counts(self, data, tars):
+        _n_class = len(self._counters)
+        _order = np.argsort(data, kind="stable")
+        _left = np.searchsorted(data[_order], tars, side="left")
+        _y = self._y[_order]
+        _one_hot = np.zeros((len(_y) + 1, _n_class), dtype=np.int64)
+        _one_hot[np.arange(1, len(_y) + 1), _y] = 1
+        counts = np.cumsum(_one_hot, axis=0)[_left]
+        counts = np.stack([counts, np.bincount(_y, minlength=_n_class) - counts], axis=1)
+        if self._sample_weight is None:
+            return counts, None
+        _one_hot = _one_hot.astype(np.float64)
+        _one_hot[1:] *= self._sample_weight[_order][..., None]
+        w_counts = np.cumsum(_one_hot, axis=0)[_left]
+        w_counts = np.stack([w_counts, np.sum(_one_hot, axis=0) - w_counts], axis=1)
+        return counts, w_counts
+
+    def _branch_chaos(self, counts, w_counts, criterion):
+        _sizes = counts.sum(axis=-1)
+        if w_counts is not None:
+            _w_sum = w_counts.sum(axis=-1, keepdims=True)
+            counts = w_counts / np.where(_w_sum > 0, _w_sum, 1) * _sizes[..., None]
+        return _sizes, Impurity.chaos(counts, criterion, self._base)
+
+    def _gains(self, counts, w_counts, criterion):
         if criterion in ("ent", "ratio"):
-            _con_chaos, _chaos_lst = self.con_chaos(idx, criterion="ent", features=features)
-            _gain = self.ent() - _con_chaos
+            _sizes, _chaos = self._branch_chaos(counts, w_counts, "ent")
+            _gain = self.ent() - np.sum(_sizes / len(self._y) * _chaos, axis=-1)
             if criterion == "ratio":
-                _gain /= self.ent(self._con_chaos_cache)
+                _gain /= Impurity.ent(_sizes, self._base)
         elif criterion == "gini":
-            _con_chaos, _chaos_lst = self.con_chaos(idx, criterion="gini", features=features)
-            _gain = self.gini() - _con_chaos
+            _sizes, _chaos = self._branch_chaos(counts, w_counts, "gini")
+            _gain = self.gini() - np.sum(_sizes / len(self._y) * _chaos, axis=-1)
         else:
             raise NotImplementedError("Info_gain criterion '{}' not defined".format(criterion))
-        return (_gain, _chaos_lst) if get_chaos_lst else _gain
+        return _sizes, _chaos, _gain
 
-    def bin_con_chaos(self, idx, tar, criterion="gini", continuous=False):
-        if criterion == "ent":
-            _method = lambda cluster: cluster.ent()
-        elif criterion == "gini":
-            _method = lambda cluster: cluster.gini()
-        else:
-            raise NotImplementedError("Conditional info criterion '{}' not defined".format(criterion))
+    # Multi-way split
+
+    def con_chaos(self, idx, criterion="ent", features=None):
+        data = self._x[idx]
+        if features is None:
+            features = set(data)
+        counts, w_counts = self._value_counts(data, list(features))
+        _sizes, _chaos = self._branch_chaos(counts, w_counts, criterion)
+        self._con_chaos_cache = _sizes.tolist()
+        return float(np.sum(_sizes / len(data) * _chaos)), _chaos.tolist()
+
+    def info_gain(self, idx, criterion="ent", get_chaos_lst=False, features=None):
+        data = self._x[idx]
+        if features is None:
+            features = set(data)
+        counts, w_counts = self._value_counts(data, list(features))
+        _sizes, _chaos, _gain = self._gains(counts, w_counts, criterion)
+        self._con_chaos_cache = _sizes.tolist()
+        return (float(_gain), _chaos.tolist()) if get_chaos_lst else float(_gain)
+
+    # Binary split
+
+    def bin_counts(self, idx, tars, continuous=False):
         data = self._x[idx]
-        tar = data == tar if not continuous else data < tar
-        tmp_labels = [tar, ~tar]
-        # noinspection PyTypeChecker
-        self._con_chaos_cache = [np.sum(_label) for _label in tmp_labels]
-        label_lst = [self._y[label] for label in tmp_labels]
-        rs, chaos_lst = 0, []
-        for data_label, tar_label in zip(tmp_labels, label_lst):
-            tmp_data = self._x.T[data_label]
-            if self._sample_weight is None:
-                _chaos = _method(Cluster(tmp_data, tar_label, base=self._base))
-            else:
-                _new_weights = self._sample_weight[data_label]
-                _chaos = _method(Cluster(tmp_data, tar_label, _new_weights / np.sum(_new_weights), base=self._base))
-            rs += len(tmp_data) / len(data) * _chaos
-            chaos_lst.append(_chaos)
-        return rs, chaos_lst
+        if continuous:
+            return self._threshold_counts(data, np.asarray(tars, dtype=np.float64))
+        counts, w_counts = self._value_counts(data, tars)
+        _total = np.bincount(self._y, minlength=len(self._counters))
+        counts = np.stack([counts, _total - counts], axis=1)
+        if w_counts is not None:
+            _w_total = np.bincount(self._y, self._sample_weight, minlength=len(self._counters))
+            w_counts = np.stack([w_counts, _w_total - w_counts], axis=1)
+        return counts, w_counts
+
+    def bin_info_gains(self, idx, tars, criterion="gini", continuous=False):
+        counts, w_counts = self.bin_counts(idx, tars, continuous)
+        _, _chaos, _gain = self._gains(counts, w_counts, criterion)
+        return _gain, _chaos
+
+    def bin_con_chaos(self, idx, tar, criterion="gini", continuous=False):
+        counts, w_counts = self.bin_counts(idx, [tar], continuous)
+        _sizes, _chaos = self._branch_chaos(counts[0], None if w_counts is None else w_counts[0], criterion)
+        self._con_chaos_cache = _sizes.tolist()
+        return float(np.sum(_sizes / len(self._y) * _chaos)), _chaos.tolist()
 
     def bin_info_gain(self, idx, tar, criterion="gini", get_chaos_lst=False, continuous=False):
-        if criterion in ("ent", "ratio"):
-            _con_chaos, _chaos_lst = self.bin_con_chaos(idx, tar, "ent", continuous)
-            _gain = self.ent() - _con_chaos
-            if criterion == "ratio":
-                # noinspection PyTypeChecker
-                _gain = _gain / self.ent(self._con_chaos_cache)
-        elif criterion == "gini":
-            _con_chaos, _chaos_lst = self.bin_con_chaos(idx, tar, "gini", continuous)
-            _gain = self.gini() - _con_chaos
-        else:
-            raise NotImplementedError("Info_gain criterion '{}' not defined".format(criterion))
-        return (_gain, _chaos_lst) if get_chaos_lst else _gain
+        counts, w_counts = self.bin_counts(idx, [tar], continuous)
+        _sizes, _chaos, _gain = self._gains(counts, w_counts, criterion)
+        self._con_chaos_cache = _sizes[0].tolist()
+        return (float(_gain[0]), _chaos[0].tolist()) if get_chaos_lst else float(_gain[0])
+
+    def bin_partition_gains(self, idx, criterion="gini"):
+        data = self._x[idx]
+        _values = np.unique(data)
+        counts, w_counts = self._value_counts(data, _values.tolist())
+        _rates = (counts if w_counts is None else w_counts).astype(np.float64)
+        _rates /= np.maximum(_rates.sum(axis=1, keepdims=True), 1e-300)
+        _classes = np.flatnonzero(self._counters)
+        _orders = [np.argsort(_rates[:, c], kind="stable") for c in _classes[-1:]]
+        if len(_classes) > 2:
+            _orders += [np.argsort(_rates[:, c], kind="stable") for c in _classes[:-1]]
+        _candidates = [_sorted[:i] for _sorted in (_values[_order] for _order in _orders)
+                       for i in range(1, len(_values))]
+        _left = [np.cumsum(counts[_order], axis=0)[:-1] for _order in _orders]
+        if w_counts is not None:
+            _w_left = [np.cumsum(w_counts[_order], axis=0)[:-1] for _order in _orders]
+        if len(_classes) > 2:
+            _candidates += [_values[i:i + 1] for i in range(len(_values))]
+            _left.append(counts)
+            if w_counts is not None:
+                _w_left.append(w_counts)
+        _left = np.vstack(_left)
+        counts = np.stack([_left, counts.sum(axis=0) - _left], axis=1)
+        if w_counts is not None:
+            _w_left = np.vstack(_w_left)
+            w_counts = np.stack([_w_left, w_counts.sum(axis=0) - _w_left], axis=1)
+        _, _chaos, _gain = self._gains(counts, w_counts, criterion)
+        return _gain, _chaos, _candidates
@@ -0,0 +1,210 @@
+import json
+import struct
+import numpy as np
+
+from Util.Timing import Timing
+from Util.Bases import ClassifierBase
+from Util.Metas import ClassifierMeta
+
+
+class FlatTree(ClassifierBase, metaclass=ClassifierMeta):
+    FlatTreeTiming = Timing()
+
+    MAGIC, VERSION = b"CVDT", 2
+    LEAF, LESS, IN, MULTI = 0, 1, 2, 3
+    _array_names = (
+        "kind", "feature", "threshold", "left", "right", "category", "edge_key", "edge_child", "distribution", "value", "importance")
+
+    def __init__(self, name="FlatTree", label_dic=None, values=None, **arrays):
+        self.name = name
+        self.label_dic = {} if label_dic is None else label_dic
+        self.values = [] if values is None else values
+        self._value_dic = {value: i for i, value in enumerate(self.values)}
+        self.kind = self.feature = self.threshold = self.left = self.right = self.category = None
+        self.edge_key = self.edge_child = self.distribution = self.value = self.importance = None
+        for key in FlatTree._array_names:
+            setattr(self, key, arrays.get(key))
+
+    def __reduce__(self):
+        return FlatTree, (self.name, self.label_dic, self.values), {
+            key: np.asarray(getattr(self, key)) for key in self._saved_names}
+
+    @property
+    def _saved_names(self):
+        return [key for key in FlatTree._array_names if getattr(self, key) is not None]
+
+    @property
+    def n_nodes(self):
+        return len(self.kind)
+
+    @property
+    def feature_importances(self):
+        return FlatTree.normalize_importance(self.importance)
+
+    @staticmethod
+    def normalize_importance(importance):
+        if importance is None:
+            return None
+        importance = np.maximum(np.asarray(importance, dtype=np.float64), 0)
+        _total = importance.sum()
+        return importance / _total if _total > 0 else importance
+
+    # Build
+
+    @staticmethod
+    def _to_builtin(value):
+        return value.item() if isinstance(value, np.generic) else value
+
+    @staticmethod
+    @FlatTreeTiming.timeit(level=1, prefix="[API] ")
+    def from_tree(tree):
+        _nodes, _stack = [], [tree.root]
+        while _stack:
+            _node = _stack.pop()
+            _nodes.append(_node)
+            if _node.category is None:
+                _stack += [_child for _child in _node.children.values() if _child is not None][::-1]
+        _pos = {id(_node): i for i, _node in enumerate(_nodes)}
+        n = len(_nodes)
+        kind, feature = np.zeros(n, dtype=np.int8), np.full(n, -1, dtype=np.int32)
+        threshold = np.zeros(n, dtype=np.float64)
+        left, right = np.full(n, -1, dtype=np.int32), np.full(n, -1, dtype=np.int32)
+        category = np.zeros(n, dtype=np.int32)
+        distribution = np.array([_node.get_distribution(len(tree.label_dic)) for _node in _nodes],
+                                dtype=np.float64).reshape(n, len(tree.label_dic))
+        values, value_dic, edges = [], {}, []
+
+        def _code(_value):
+            _value = FlatTree._to_builtin(_value)
+            if _value not in value_dic:
+                value_dic[_value] = len(values)
+                values.append(_value)
+            return value_dic[_value]
+
+        for i, _node in enumerate(_nodes):
+            if _node.category is not None:
+                category[i] = _node.category
+                continue
+            feature[i] = _node.feature_dim
+            if _node.is_continuous or _node.is_cart:
+                left[i], right[i] = _pos[id(_node.left_child)], _pos[id(_node.right_child)]
+                if _node.is_continuous:
+                    kind[i], threshold[i] = FlatTree.LESS, _node.tar
+                else:
+                    kind[i] = FlatTree.IN
+                    _tar = _node.tar if isinstance(_node.tar, frozenset) else [_node.tar]
+                    edges += [(i, _code(_value), left[i]) for _value in _tar]
+            else:
+                kind[i], category[i] = FlatTree.MULTI, _node.get_category()
+                edges += [(i, _code(_value), _pos[id(_child)]) for _value, _child in _node.children.items()]
+        edges = np.array(edges, dtype=np.int64).reshape(-1, 3)
+        edge_key = edges[..., 0] * max(1, len(values)) + edges[..., 1]
+        _order = np.argsort(edge_key)
+        label_dic = {key: FlatTree._to_builtin(value) for key, value in tree.label_dic.items()}
+        return FlatTree(
+            str(tree), label_dic, values,
+            kind=kind, feature=feature, threshold=threshold, left=left, right=right, category=category,
+            edge_key=edge_key[_order], edge_child=edges[_order, 2].astype(np.int32), distribution=distribution,
+            importance=None if tree.importance is None else np.array(tree.importance)
+        )
+
+    # IO
+
+    @FlatTreeTiming.timeit(level=1, prefix="[API] ")
+    def save(self, path):
+        _arrays, _offset = {}, 0
+        for key in self._saved_names:
+            arr = np.ascontiguousarray(getattr(self, key))
+            _arrays[key] = [_offset, arr.dtype.str, list(arr.shape)]
+            _offset += -(-arr.nbytes // 8) * 8
+        header = json.dumps({
+            "name": self.name,
+            "labels": [[key, value] for key, value in self.label_dic.items()],
+            "values": self.values,
+            "arrays": _arrays
+        }).encode("utf8")
+        header += b" " * (-(len(header) + 16) % 8)
+        with open(path, "wb") as file:
+            file.write(FlatTree.MAGIC + struct.pack("<IQ", FlatTree.VERSION, len(header)) + header)
+            for key in self._saved_names:
+                _bytes = np.ascontiguousarray(getattr(self, key)).tobytes()
+                file.write(_bytes + b"\0" * (-len(_bytes) % 8))
+
+    @staticmethod
+    @FlatTreeTiming.timeit(level=1, prefix="[API] ")
+    def load(path):
+        with open(path, "rb") as file:
+            magic, (version, header_len) = file.read(4), struct.unpack("<IQ", file.read(12))
+            if magic != FlatTree.MAGIC:
+                raise ValueError("'{}' is not a flattened tree file".format(path))
+            if version > FlatTree.VERSION:
+                raise ValueError("Flattened tree version {} is not supported".format(version))
+            header = json.loads(file.read(header_len).decode("utf8"))
+        _buffer = np.memmap(path, dtype=np.uint8, mode="r", offset=16 + header_len)
+        arrays = {}
+        for key, (offset, dtype, shape) in header["arrays"].items():
+            dtype = np.dtype(dtype)
+            _size = int(np.prod(shape)) * dtype.itemsize
+            arrays[key] = _buffer[offset:offset + _size].view(dtype).reshape(shape)
+        label_dic = {key: value for key, value in header["labels"]}
+        return FlatTree(header["name"], label_dic, header["values"], **arrays)
+
+    # Util
+
+    def _codes(self, column):
+        return np.array([self._value_dic.get(FlatTree._to_builtin(value), -1) for value in column], dtype=np.int64)
+
+    @FlatTreeTiming.timeit(level=1, prefix="[Core] ")
+    def apply(self, x):
+        x = np.atleast_2d(x)
+        nodes, rows = np.zeros(len(x), dtype=np.int64), np.arange(len(x))
+        _codes, n_values = {}, max(1, len(self.values))
+        while len(rows):
+            _cur = nodes[rows]
+            _kind = self.kind[_cur]
+            _next = np.full(len(rows), -1, dtype=np.int64)
+            _mask = _kind == FlatTree.LESS
+            if np.any(_mask):
+                _r, _c = rows[_mask], _cur[_mask]
+                _next[_mask] = np.where(
+                    x[_r, self.feature[_c]].astype(np.float64) < self.threshold[_c], self.left[_c], self.right[_c])
+            _mask = (_kind == FlatTree.IN) | (_kind == FlatTree.MULTI)
+            if np.any(_mask):
+                _r, _c = rows[_mask], _cur[_mask]
+                _code = np.empty(len(_r), dtype=np.int64)
+                for _feat in np.unique(self.feature[_c]):
+                    if _feat not in _codes:
+                        _codes[_feat] = self._codes(x[..., _feat])
+                    _feat_mask = self.feature[_c] == _feat
+                    _code[_feat_mask] = _codes[_feat][_r[_feat_mask]]
+                _key = np.where(_code >= 0, _c * n_values + _code, -1)
+                _pos = np.minimum(np.searchsorted(self.edge_key, _key), len(self.edge_key) - 1)
+                _found = self.edge_key[_pos] == _key
+                _child = np.where(_found, self.edge_child[_pos], -1)
+                _next[_mask] = np.where((self.kind[_c] == FlatTree.IN) & ~_found, self.right[_c], _child)
+            _moved = _next >= 0
+            nodes[rows[_moved]] = _next[_moved]
+            rows = rows[_moved]
+        return nodes
+
+    @FlatTreeTiming.timeit(level=1, prefix="[API] ")
+    def predict(self, x, get_raw_results=False):
+        categories = self.category[self.apply(x)]
+        if get_raw_results:
+            return categories
+        labels = np.array([self.label_dic[i] for i in range(len(self.label_dic))])
+        return labels[categories]
+
+    @FlatTreeTiming.timeit(level=1, prefix="[API] ")
+    def predict_distribution(self, x):
+        nodes = self.apply(x)
+        if self.distribution is None:
+            rs = np.zeros((len(nodes), len(self.label_dic)))
+            rs[np.arange(len(nodes)), self.category[nodes]] = 1
+            return rs
+        rs = self.distribution[nodes].astype(np.float64)
+        return rs / rs.sum(axis=1, keepdims=True)
+
+    @FlatTreeTiming.timeit(level=1, prefix="[API] ")
+    def predict_value(self, x):
+        return self.value[self.apply(x)]
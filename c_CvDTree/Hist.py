@@ -0,0 +1,121 @@
+import numpy as np
+
+from c_CvDTree.Flat import FlatTree
+
+from Util.Timing import Timing
+from Util.Bases import TimingBase
+from Util.Metas import TimingMeta
+
+
+class BinMapper(TimingBase, metaclass=TimingMeta):
+    BinMapperTiming = Timing()
+
+    def __init__(self, max_bin=255):
+        self.max_bin = max_bin
+        self.edges, self.n_bins = [], 1
+
+    def fit(self, x):
+        self.edges = []
+        for column in np.atleast_2d(x).T:
+            _values, _counts = np.unique(column, return_counts=True)
+            if len(_values) <= self.max_bin:
+                self.edges.append(_values[:-1])
+                continue
+            _cum = np.cumsum(_counts)
+            _idx = np.searchsorted(_cum, np.linspace(0, _cum[-1], self.max_bin + 1)[1:-1])
+            self.edges.append(_values[np.unique(np.minimum(_idx, len(_values) - 2))])
+        self.n_bins = max([len(_edges) + 1 for _edges in self.edges] + [1])
+        return self
+
+    def transform(self, x):
+        x = np.atleast_2d(x)
+        codes = np.empty(x.shape, dtype=np.uint8 if self.n_bins <= 256 else np.uint16)
+        for i, _edges in enumerate(self.edges):
+            codes[..., i] = np.searchsorted(_edges, x[..., i])
+        return codes
+
+
+class HistTree(TimingBase, metaclass=TimingMeta):
+    """
+    Newton-step regression tree on binned features, used by GradientBoosting
+    """
+    HistTreeTiming = Timing()
+
+    def __init__(self, max_depth=3, min_samples_leaf=20, reg_lambda=1., min_gain=0.):
+        self.max_depth, self.min_samples_leaf = max_depth, min_samples_leaf
+        self.reg_lambda, self.min_gain = reg_lambda, min_gain
+        self.kind, self.feature, self.threshold = [], [], []
+        self.left, self.right, self.value = [], [], []
+
+    def _histogram(self, codes, rows, grad, hess, n_bins):
+        n_feat = codes.shape[1]
+        _flat = (codes[rows].astype(np.int64) + np.arange(n_feat) * n_bins).ravel()
+        _size = n_feat * n_bins
+        return np.array([
+            np.bincount(_flat, np.repeat(grad[rows], n_feat), minlength=_size),
+            np.bincount(_flat, np.repeat(hess[rows], n_feat), minlength=_size),
+            np.bincount(_flat, minlength=_size)
+        ]).reshape(3, n_feat, n_bins)
+
+    def _score(self, g, h):
+        return g ** 2 / (h + self.reg_lambda)
+
+    def _best_split(self, hist):
+        _left = np.cumsum(hist, axis=2)[..., :-1]
+        _total = hist[:, 0].sum(axis=1)
+        _right = _total[:, None, None] - _left
+        _gains = (self._score(_left[0], _left[1]) + self._score(_right[0], _right[1]) -
+                  self._score(_total[0], _total[1]))
+        _gains[(_left[2] < self.min_samples_leaf) | (_right[2] < self.min_samples_leaf)] = -np.inf
+        if _gains.size == 0:
+            return -np.inf, 0, 0
+        _feat, _bin = np.unravel_index(np.argmax(_gains), _gains.shape)
+        return _gains[_feat, _bin], _feat, _bin
+
+    def _add_node(self, g, h):
+        self.kind.append(FlatTree.LEAF)
+        self.feature.append(-1)
+        self.threshold.append(0.)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.value.append(-g / (h + self.reg_lambda))
+        return len(self.kind) - 1
+
+    def fit(self, codes, grad, hess, n_bins, rows=None, feats=None):
+        if rows is None:
+            rows = np.arange(len(codes))
+        if feats is None:
+            feats = np.arange(codes.shape[1])
+        _codes = codes[np.ix_(rows, feats)]
+        grad, hess = grad[rows], hess[rows]
+        _rows = np.arange(len(rows))
+        _hist = self._histogram(_codes, _rows, grad, hess, n_bins)
+        _stack = [(self._add_node(grad.sum(), hess.sum()), _rows, _hist, 0)]
+        while _stack:
+            _node, _rows, _hist, _depth = _stack.pop()
+            if self.max_depth is not None and _depth >= self.max_depth:
+                continue
+            _gain, _feat, _bin = self._best_split(_hist)
+            if not _gain > self.min_gain:
+                continue
+            _mask = _codes[_rows, _feat] <= _bin
+            _left_rows, _right_rows = _rows[_mask], _rows[~_mask]
+            if len(_left_rows) <= len(_right_rows):
+                _left_hist = self._histogram(_codes, _left_rows, grad, hess, n_bins)
+                _right_hist = _hist - _left_hist
+            else:
+                _right_hist = self._histogram(_codes, _right_rows, grad, hess, n_bins)
+                _left_hist = _hist - _right_hist
+            self.kind[_node], self.feature[_node], self.threshold[_node] = FlatTree.LESS, feats[_feat], _bin + 0.5
+            self.left[_node] = self._add_node(_left_hist[0, 0].sum(), _left_hist[1, 0].sum())
+            self.right[_node] = self._add_node(_right_hist[0, 0].sum(), _right_hist[1, 0].sum())
+            _stack.append((self.right[_node], _right_rows, _right_hist, _depth + 1))
+            _stack.append((self.left[_node], _left_rows, _left_hist, _depth + 1))
+        return self
+
+    def flatten(self):
+        return FlatTree(
+            "HistTree", kind=np.array(self.kind, dtype=np.int8), feature=np.array(self.feature, dtype=np.int32),
+            threshold=np.array(self.threshold), left=np.array(self.left, dtype=np.int32),
+            right=np.array(self.right, dtype=np.int32), value=np.array(self.value)
+        )
@@ -11,7 +11,9 @@ class CvDNode:
         self.base, self.chaos = base, chaos
         self.criterion = self.category = None
         self.left_child = self.right_child = None
-        self._children, self.leafs = {}, {}
+        self._children = {}
+        self.leaf_cost, self.leaf_num = 0, 0
+        self.decrease = 0
         self.sample_weight = None
         self.wc = None
 
@@ -22,7 +24,7 @@ class CvDNode:
         self.feature_dim, self.tar, self.feats = None, None, []
         self.parent, self.is_root = parent, is_root
         self._depth, self.prev_feat = depth, prev_feat
-        self.is_cart = self.is_continuous = self.affected = self.pruned = False
+        self.is_cart = self.is_continuous = self.pruned = False
 
     def __getitem__(self, item):
         if isinstance(item, str):
@@ -52,13 +54,6 @@ class CvDNode:
             return 1
         return 1 + max([_child.height if _child is not None else 0 for _child in self.children.values()])
 
-    @property
-    def info_dic(self):
-        return {
-            "chaos": self.chaos,
-            "y": self._y
-        }
-
     # Grow
 
     def stop1(self, eps):
@@ -79,30 +74,46 @@ class CvDNode:
     def get_category(self):
         return np.argmax(np.bincount(self._y))
 
+    def get_distribution(self, n_category):
+        """
+        :return: class distribution of the node, weighted by sample_weight if it is provided
+        """
+        _counts = np.bincount(self._y, weights=self.sample_weight, minlength=n_category)
+        return _counts / _counts.sum()
+
     def _handle_terminate(self):
         self.category = self.get_category()
+        self.leaf_num = 1
+        if self.chaos is not None:
+            self.leaf_cost = self.cost(pruned=True)
+        self._update_ancestors(self.leaf_cost, 1)
+
+    def _update_ancestors(self, d_cost, d_num):
         _parent = self.parent
         while _parent is not None:
-            _parent.leafs[id(self)] = self.info_dic
+            _parent.leaf_cost += d_cost
+            _parent.leaf_num += d_num
             _parent = _parent.parent
 
     def prune(self):
         self.category = self.get_category()
-        _pop_lst = [key for key in self.leafs]
-        _parent = self.parent
-        while _parent is not None:
-            _parent.affected = True
-            for _k in _pop_lst:
-                _parent.leafs.pop(_k)
-            _parent.leafs[id(self)] = self.info_dic
-            _parent = _parent.parent
+        _cost = self.cost(pruned=True)
+        self._update_ancestors(_cost - self.leaf_cost, 1 - self.leaf_num)
+        self.leaf_cost, self.leaf_num = _cost, 1
         self.mark_pruned()
         self.feature_dim = None
         self.left_child = self.right_child = None
         self._children = {}
-        self.leafs = {}
+
+    def unprune(self, snapshot):
+        self.category = None
+        self.feature_dim, self.left_child, self.right_child, self._children, _cost, _num = snapshot
+        self._update_ancestors(_cost - self.leaf_cost, _num - self.leaf_num)
+        self.leaf_cost, self.leaf_num = _cost, _num
 
     def mark_pruned(self):
+        if not self.pruned and self.feature_dim is not None:
+            self.tree.importance[self.feature_dim] -= self.decrease
         self.pruned = True
         for _child in self.children.values():
             if _child is not None:
@@ -122,12 +133,13 @@ class CvDNode:
         _max_gain, _chaos_lst = 0, []
         _max_feature = _max_tar = None
         feat_len = len(self.feats)
+        _random = np.random if self.tree.random_state is None else self.tree.random_state
         if feature_bound is None:
             indices = range(0, feat_len)
         elif feature_bound == "log":
-            indices = np.random.permutation(feat_len)[:max(1, int(log2(feat_len)))]
+            indices = _random.permutation(feat_len)[:max(1, int(log2(feat_len)))]
         else:
-            indices = np.random.permutation(feat_len)[:feature_bound]
+            indices = _random.permutation(feat_len)[:feature_bound]
         tmp_feats = [self.feats[i] for i in indices]
         for feat in tmp_feats:
             if self.wc[feat]:
@@ -138,12 +150,24 @@ class CvDNode:
                     _set = self.tree.feature_sets[feat]
                 else:
                     _set = None
-            if self.is_cart or self.wc[feat]:
-                for tar in _set:
-                    _tmp_gain, _tmp_chaos_lst = _cluster.bin_info_gain(
-                        feat, tar, criterion=self.criterion, get_chaos_lst=True, continuous=self.wc[feat])
-                    if _tmp_gain > _max_gain:
-                        (_max_gain, _chaos_lst), _max_feature, _max_tar = (_tmp_gain, _tmp_chaos_lst), feat, tar
+            if self.is_cart and not self.wc[feat] and self.tree.categorical_split == "partition":
+                _gains, _chaos_lsts, _set = _cluster.bin_partition_gains(feat, criterion=self.criterion)
+                if len(_set) == 0:
+                    continue
+                p = np.argmax(_gains)
+                if _gains[p] > _max_gain:
+                    _tar = _set[p].tolist()
+                    _tar = _tar[0] if len(_tar) == 1 else frozenset(_tar)
+                    (_max_gain, _chaos_lst), _max_feature, _max_tar = (_gains[p], _chaos_lsts[p].tolist()), feat, _tar
+            elif self.is_cart or self.wc[feat]:
+                _set = list(_set)
+                if not _set:
+                    continue
+                _gains, _chaos_lsts = _cluster.bin_info_gains(
+                    feat, _set, criterion=self.criterion, continuous=self.wc[feat])
+                p = np.argmax(_gains)
+                if _gains[p] > _max_gain:
+                    (_max_gain, _chaos_lst), _max_feature, _max_tar = (_gains[p], _chaos_lsts[p].tolist()), feat, _set[p]
             else:
                 _tmp_gain, _tmp_chaos_lst = _cluster.info_gain(
                     feat, self.criterion, True, self.tree.feature_sets[feat])
@@ -162,6 +186,10 @@ class CvDNode:
         else:
             self._gen_children(_chaos_lst, feature_bound)
 
+    def _record_split(self, sizes, chaos_lst):
+        self.decrease = self.chaos * len(self._y) - np.dot(sizes, chaos_lst)
+        self.tree.importance[self.feature_dim] += self.decrease
+
     def _gen_children(self, _chaos_lst, feature_bound):
         feat, tar = self.feature_dim, self.tar
         self.is_continuous = continuous = self.wc[feat]
@@ -172,13 +200,23 @@ class CvDNode:
             _masks = [_mask, ~_mask]
         else:
             if self.is_cart:
-                _mask = features == tar
+                if isinstance(tar, frozenset):
+                    _mask = np.isin(features, list(tar))
+                else:
+                    _mask = features == tar
                 _masks = [_mask, ~_mask]
-                self.tree.feature_sets[feat].discard(tar)
+                if self.tree.categorical_split != "partition":
+                    self.tree.feature_sets[feat].discard(tar)
             else:
                 _masks = None
         if self.is_cart or continuous:
-            _feats = [tar, "+"] if not continuous else ["{:6.4}-".format(tar), "{:6.4}+".format(tar)]
+            self._record_split([np.sum(_mask) for _mask in _masks], _chaos_lst)
+            if continuous:
+                _feats = ["{:6.4}-".format(tar), "{:6.4}+".format(tar)]
+            elif isinstance(tar, frozenset):
+                _feats = ["/".join(sorted(map(str, tar))), "+"]
+            else:
+                _feats = [tar, "+"]
             for _feat, side, _chaos in zip(_feats, ["left_child", "right_child"], _chaos_lst):
                 _new_node = self.__class__(
                     self.tree, self.base, chaos=_chaos,
@@ -198,6 +236,8 @@ class CvDNode:
                 _node.fit(tmp_data, tmp_labels, _local_weights, feature_bound)
         else:
             _new_feats.remove(self.feature_dim)
+            self._record_split(
+                [np.sum(features == feat) for feat in self.tree.feature_sets[self.feature_dim]], _chaos_lst)
             for feat, _chaos in zip(self.tree.feature_sets[self.feature_dim], _chaos_lst):
                 _feat_mask = features == feat
                 tmp_x = self._x[_feat_mask, ...]
@@ -226,11 +266,11 @@ class CvDNode:
 
     def cost(self, pruned=False):
         if not pruned:
-            return sum([leaf["chaos"] * len(leaf["y"]) for leaf in self.leafs.values()])
+            return self.leaf_cost
         return self.chaos * len(self._y)
 
     def get_threshold(self):
-        return (self.cost(pruned=True) - self.cost()) / (len(self.leafs) - 1)
+        return (self.cost(pruned=True) - self.cost()) / (self.leaf_num - 1)
 
     def cut_tree(self):
         self.tree = None
@@ -246,6 +286,11 @@ class CvDNode:
             if child is not None:
                 child.feed_tree(tree)
 
+    def is_left(self, value):
+        if isinstance(self.tar, frozenset):
+            return value in self.tar
+        return value == self.tar
+
     def predict_one(self, x):
         if self.category is not None:
             return self.category
@@ -254,7 +299,7 @@ class CvDNode:
                 return self.left_child.predict_one(x)
             return self.right_child.predict_one(x)
         if self.is_cart:
-            if x[self.feature_dim] == self.tar:
+            if self.is_left(x[self.feature_dim]):
                 return self.left_child.predict_one(x)
             return self.right_child.predict_one(x)
         else:
@@ -266,6 +311,20 @@ class CvDNode:
     def predict(self, x):
         return np.array([self.predict_one(xx) for xx in x])
 
+    def get_path(self, x):
+        _node, _path = self, [self]
+        while _node.category is None:
+            if _node.is_continuous:
+                _node = _node.left_child if x[_node.feature_dim] < _node.tar else _node.right_child
+            elif _node.is_cart:
+                _node = _node.left_child if _node.is_left(x[_node.feature_dim]) else _node.right_child
+            else:
+                _node = _node.children.get(x[_node.feature_dim])
+                if _node is None:
+                    break
+            _path.append(_node)
+        return _path
+
     def view(self, indent=4):
         print(" " * indent * self._depth, self)
         for _node in sorted(self.children):
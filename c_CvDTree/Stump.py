@@ -0,0 +1,123 @@
+import numpy as np
+
+from c_CvDTree.Flat import FlatTree
+
+from Util.Timing import Timing
+from Util.Bases import ClassifierBase
+from Util.Metas import ClassifierMeta
+
+
+class Stump(ClassifierBase, metaclass=ClassifierMeta):
+    StumpTiming = Timing()
+
+    def __init__(self, whether_continuous=None):
+        self._labels, self.label_dic = None, {}
+        self.whether_continuous = whether_continuous
+        self.feature_dim, self.tar, self.is_continuous = None, -np.inf, True
+        self.left_category = self.right_category = 0
+        self.left_distribution = self.right_distribution = None
+        self.importance = None
+
+    @property
+    def feature_importances(self):
+        return FlatTree.normalize_importance(self.importance)
+
+    @staticmethod
+    @StumpTiming.timeit(level=1, prefix="[API] ")
+    def encode(x):
+        """
+        :return: x as float64 with non-numeric columns replaced by the codes of their categories,
+                 and whether each column is numeric
+        """
+        x = np.atleast_2d(x)
+        if x.dtype.kind in "biuf":
+            return x.astype(np.float64), np.ones(x.shape[1], dtype=bool)
+        rs, numeric = np.empty(x.shape), np.ones(x.shape[1], dtype=bool)
+        for i, column in enumerate(x.T):
+            try:
+                rs[..., i] = column.astype(np.float64)
+            except ValueError:
+                rs[..., i] = np.unique(column, return_inverse=True)[1]
+                numeric[i] = False
+        return rs, numeric
+
+    @staticmethod
+    @StumpTiming.timeit(level=1, prefix="[API] ")
+    def presort(codes):
+        """
+        :param codes: the output of Stump.encode
+        """
+        return np.argsort(codes[0], axis=0, kind="stable")
+
+    @StumpTiming.timeit(level=1, prefix="[API] ")
+    def fit(self, x, y, sample_weight=None, codes=None, order=None):
+        """
+        :param codes: Stump.encode(x), computed here if not provided
+        :param order: Stump.presort(codes), computed here if not provided
+        """
+        x, y = np.atleast_2d(x), np.array(y)
+        if sample_weight is None:
+            sample_weight = np.ones(len(y)) / len(y)
+        _x, _numeric = Stump.encode(x) if codes is None else codes
+        if self.whether_continuous is None:
+            self.whether_continuous = _numeric
+        else:
+            self.whether_continuous = np.array(self.whether_continuous, dtype=bool) & _numeric
+        if order is None:
+            order = np.argsort(_x, axis=0, kind="stable")
+        self._labels = np.unique(y)
+        self.label_dic = dict(enumerate(self._labels))
+        _y = np.searchsorted(self._labels, y)
+        _weights = np.zeros((len(y), len(self._labels)))
+        _weights[np.arange(len(y)), _y] = sample_weight
+        _total = _weights.sum(axis=0)
+        # Continuous features: x < tar vs x >= tar, for every position of the presorted columns
+        _left = np.cumsum(_weights[order], axis=0)
+        _left = np.concatenate([np.zeros((1,) + _left.shape[1:]), _left[:-1]])
+        _right = _total - _left
+        _err = sample_weight.sum() - _left.max(axis=2) - _right.max(axis=2)
+        _sorted = np.take_along_axis(_x, order, axis=0)
+        _err[1:][_sorted[1:] == _sorted[:-1]] = np.inf
+        _err[..., ~self.whether_continuous] = np.inf
+        _k, self.feature_dim = np.unravel_index(np.argmin(_err), _err.shape)
+        _best_err, self.is_continuous = _err[_k, self.feature_dim], True
+        _best_left, _best_right = _left[_k, self.feature_dim], _right[_k, self.feature_dim]
+        # Categorical features: x == tar vs x != tar, for every category of the columns
+        for i in np.flatnonzero(~self.whether_continuous):
+            _codes = _x[..., i].astype(np.int64)
+            _cat_left = np.zeros((_codes.max() + 1, len(self._labels)))
+            np.add.at(_cat_left, (_codes, _y), sample_weight)
+            _cat_right = _total - _cat_left
+            _cat_err = sample_weight.sum() - _cat_left.max(axis=1) - _cat_right.max(axis=1)
+            _code = np.argmin(_cat_err)
+            if _cat_err[_code] < _best_err:
+                _best_err, self.feature_dim, self.is_continuous = _cat_err[_code], i, False
+                _best_left, _best_right = _cat_left[_code], _cat_right[_code]
+                self.tar = x[np.argmax(_codes == _code), i]
+        self.left_category, self.right_category = np.argmax(_best_left), np.argmax(_best_right)
+        self.left_distribution = _best_left / max(_best_left.sum(), np.finfo(np.float64).tiny)
+        self.right_distribution = _best_right / max(_best_right.sum(), np.finfo(np.float64).tiny)
+        self.importance = np.zeros(x.shape[1])
+        self.importance[self.feature_dim] = sample_weight.sum() - _total.max() - _best_err
+        if self.is_continuous:
+            if _k == 0:
+                self.tar = -np.inf
+            else:
+                self.tar = (_sorted[_k - 1, self.feature_dim] + _sorted[_k, self.feature_dim]) * 0.5
+
+    def _go_left(self, x):
+        _column = np.atleast_2d(x)[..., self.feature_dim]
+        if self.is_continuous:
+            return _column.astype(np.float64) < self.tar
+        return _column == self.tar
+
+    @StumpTiming.timeit(level=1, prefix="[API] ")
+    def predict_distribution(self, x):
+        return np.where(self._go_left(x)[..., None], self.left_distribution, self.right_distribution)
+
+    @StumpTiming.timeit(level=1, prefix="[API] ")
+    def predict(self, x, get_raw_results=False):
+        rs = np.where(self._go_left(x), self.left_category, self.right_category)
+        if get_raw_results:
+            return rs
+        return self._labels[rs]
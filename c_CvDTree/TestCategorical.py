@@ -0,0 +1,46 @@
+import time
+
+from c_CvDTree.Tree import *
+
+
+def gen_categorical(size=5000, n_category=300, n_noise=3, noise=0.1):
+    rates = np.random.random(n_category)
+    x = np.random.randint(n_category, size=(size, 1 + n_noise))
+    y = (np.random.random(size) < rates[x[..., 0]]).astype(np.int8)
+    flip = np.random.random(size) < noise
+    y[flip] = 1 - y[flip]
+    return x.astype(np.double), y
+
+
+def main():
+    x, y = gen_categorical()
+    train_num = 4000
+    x_train, y_train, x_test, y_test = x[:train_num], y[:train_num], x[train_num:], y[train_num:]
+    _wc = [False] * x.shape[1]
+
+    for categorical_split in ("one_vs_rest", "partition"):
+        print("=" * 30)
+        print("Categorical split: {}".format(categorical_split))
+        print("-" * 30)
+        np.random.seed(142857)
+        _fit_time = time.time()
+        _tree = CartTree(whether_continuous=_wc, max_depth=1, categorical_split=categorical_split)
+        _tree.fit(x_train, y_train, train_only=True)
+        _fit_time = time.time() - _fit_time
+        _estimate_time = time.time()
+        _tree.estimate(x_train, y_train)
+        _tree.estimate(x_test, y_test)
+        _estimate_time = time.time() - _estimate_time
+        print(
+            "Tree height     : {:12d}\n"
+            "Model building  : {:12.6} s\n"
+            "Estimation      : {:12.6} s\n"
+            "Total           : {:12.6} s".format(
+                _tree.root.height, _fit_time, _estimate_time,
+                _fit_time + _estimate_time
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+from c_CvDTree.Tree import *
+
+from Util.Util import DataUtil
+
+
+def fit_tree(x, y):
+    np.random.seed(142857)
+    _tree = CartTree()
+    _tree.fit(x, y, train_only=True)
+    return _tree
+
+
+def check(name, tree, fresh):
+    _events, _fresh_events = tree.prune_events, fresh.prune_events
+    print("{:<8s}: {:3d} prune events  (match: {})".format(
+        name, len(_events), len(_events) == len(_fresh_events) and np.allclose(
+            [threshold for threshold, _ in _events], [threshold for threshold, _ in _fresh_events])))
+
+
+def main():
+    x, y = DataUtil.gen_spin(size=200, n=4, n_class=3, one_hot=False)
+    _n_level = len(fit_tree(x, y)._cart_prune())
+    for level in (0, _n_level // 2, _n_level - 1):
+        _tree, _fresh = fit_tree(x, y), fit_tree(x, y)
+        _tree._replay_prune(level, _tree._cart_prune())
+        _fresh._replay_prune(level, _fresh._cart_prune())
+        print("{:<8s}: {:3d} leaves        (match: {})".format(
+            "level {}".format(level), _tree.root.leaf_num, _tree.root.leaf_num == _fresh.root.leaf_num and
+            np.isclose(_tree.root.leaf_cost, _fresh.root.leaf_cost)))
+        _tree._cart_prune()
+        _fresh = fit_tree(x, y)
+        _fresh._cart_prune()
+        _fresh.prune_events = _fresh.prune_events[level:]
+        check("re-prune", _tree, _fresh)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 import cv2
+import heapq
 from copy import deepcopy
 
 from c_CvDTree.Node import *
+from c_CvDTree.Flat import FlatTree
 
 from Util.Timing import Timing
 from Util.Bases import ClassifierBase
@@ -11,19 +13,23 @@ from Util.Metas import ClassifierMeta
 class CvDBase(ClassifierBase, metaclass=ClassifierMeta):
     CvDBaseTiming = Timing()
 
-    def __init__(self, whether_continuous=None, max_depth=None, node=None):
-        self.nodes, self.layers, self.roots = [], [], []
+    def __init__(self, whether_continuous=None, max_depth=None, node=None, categorical_split="partition"):
+        self.nodes, self.layers, self.prune_events = [], [], []
         self.max_depth = max_depth
+        self.categorical_split = categorical_split
         self.root = node
         self.feature_sets = []
         self.label_dic = {}
+        self.importance = None
         self.prune_alpha = 1
         self.whether_continuous = whether_continuous
+        self.random_state = None
 
     def feed_data(self, x, continuous_rate=0.2):
         xt = x.T
         self.feature_sets = [set(dimension) for dimension in xt]
         data_len, data_dim = x.shape
+        self.importance = np.zeros(data_dim)
         if self.whether_continuous is None:
             self.whether_continuous = np.array(
                 [len(feat) >= continuous_rate * data_len for feat in self.feature_sets])
@@ -36,7 +42,12 @@ class CvDBase(ClassifierBase, metaclass=ClassifierMeta):
 
     @CvDBaseTiming.timeit(level=1, prefix="[API] ")
     def fit(self, x, y, sample_weight=None, alpha=None, eps=1e-8,
-            cv_rate=0.2, train_only=False, feature_bound=None):
+            cv_rate=0.2, train_only=False, feature_bound=None, random_state=None):
+        """
+        :param random_state: np.random.RandomState used for the cross validation split & feature sampling,
+                             the global random state of NumPy is used if not provided
+        """
+        self.random_state = random_state
         _dic = {c: i for i, c in enumerate(set(y))}
         y = np.array([_dic[yy] for yy in y])
         self.label_dic = {value: key for key, value in _dic.items()}
@@ -44,7 +55,8 @@ class CvDBase(ClassifierBase, metaclass=ClassifierMeta):
         self.prune_alpha = alpha if alpha is not None else x.shape[1] / 2
         if not train_only and self.root.is_cart:
             _train_num = int(len(x) * (1-cv_rate))
-            _indices = np.random.permutation(np.arange(len(x)))
+            _random = np.random if self.random_state is None else self.random_state
+            _indices = _random.permutation(np.arange(len(x)))
             _train_indices = _indices[:_train_num]
             _test_indices = _indices[_train_num:]
             if sample_weight is not None:
@@ -79,67 +91,88 @@ class CvDBase(ClassifierBase, metaclass=ClassifierMeta):
     @CvDBaseTiming.timeit(level=1)
     def _prune(self):
         self._update_layers()
-        _tmp_nodes = []
         for _node_lst in self.layers[::-1]:
             for _node in _node_lst[::-1]:
-                if _node.category is None:
-                    _tmp_nodes.append(_node)
-        _old = np.array([node.cost() + self.prune_alpha * len(node.leafs) for node in _tmp_nodes])
-        _new = np.array([node.cost(pruned=True) + self.prune_alpha for node in _tmp_nodes])
-        _mask = _old >= _new
-        while True:
-            if self.root.height == 1:
-                break
-            p = np.argmax(_mask)
-            if _mask[p]:
-                _tmp_nodes[p].prune()
-                for i, node in enumerate(_tmp_nodes):
-                    if node.affected:
-                        _old[i] = node.cost() + self.prune_alpha * len(node.leafs)
-                        _mask[i] = _old[i] >= _new[i]
-                        node.affected = False
-                for i in range(len(_tmp_nodes) - 1, -1, -1):
-                    if _tmp_nodes[i].pruned:
-                        _tmp_nodes.pop(i)
-                        _old = np.delete(_old, i)
-                        _new = np.delete(_new, i)
-                        _mask = np.delete(_mask, i)
-            else:
-                break
+                if _node.category is None and not _node.pruned:
+                    _old = _node.cost() + self.prune_alpha * _node.leaf_num
+                    _new = _node.cost(pruned=True) + self.prune_alpha
+                    if _old >= _new:
+                        _node.prune()
         self.reduce_nodes()
 
     @CvDBaseTiming.timeit(level=1)
     def _cart_prune(self):
-        self.root.cut_tree()
+        self.prune_events = []
         _tmp_nodes = [node for node in self.nodes if node.category is None]
-        _thresholds = np.array([node.get_threshold() for node in _tmp_nodes])
-        while True:
-            root_copy = deepcopy(self.root)
-            self.roots.append(root_copy)
-            if self.root.height == 1:
-                break
-            p = np.argmin(_thresholds)
-            _tmp_nodes[p].prune()
-            for i, node in enumerate(_tmp_nodes):
-                if node.affected:
-                    _thresholds[i] = node.get_threshold()
-                    node.affected = False
-            for i in range(len(_tmp_nodes) - 1, -1, -1):
-                if _tmp_nodes[i].pruned:
-                    _tmp_nodes.pop(i)
-                    _thresholds = np.delete(_thresholds, i)
-        self.reduce_nodes()
+        _order = {id(node): i for i, node in enumerate(_tmp_nodes)}
+        _thresholds = [node.get_threshold() for node in _tmp_nodes]
+        _heap = [(threshold, i) for i, threshold in enumerate(_thresholds)]
+        heapq.heapify(_heap)
+        _snapshots = {}
+        while self.root.category is None:
+            _threshold, p = heapq.heappop(_heap)
+            _node = _tmp_nodes[p]
+            if _node.pruned or _threshold != _thresholds[p]:
+                continue
+            _snapshots[id(_node)] = (_node, (
+                _node.feature_dim, _node.left_child, _node.right_child, _node._children,
+                _node.leaf_cost, _node.leaf_num
+            ))
+            self.prune_events.append((_threshold, id(_node)))
+            _node.prune()
+            _parent = _node.parent
+            while _parent is not None:
+                i = _order[id(_parent)]
+                _thresholds[i] = _parent.get_threshold()
+                heapq.heappush(_heap, (_thresholds[i], i))
+                _parent = _parent.parent
+        return _snapshots
+
+    @CvDBaseTiming.timeit(level=1)
+    def _cart_prune_scores(self, paths, y_cv, weights):
+        _n_level = len(self.prune_events) + 1
+        _steps = {node_id: i + 1 for i, (_, node_id) in enumerate(self.prune_events)}
+        _diff = np.zeros(_n_level + 1)
+        if weights is None:
+            weights = np.ones(len(y_cv))
+        for _path, _y, _w in zip(paths, y_cv, weights):
+            _end = _n_level
+            for _node in _path:
+                _step = _steps.get(id(_node))
+                if _step is not None and _step < _end:
+                    if _node.category == _y:
+                        _diff[_step] += _w
+                        _diff[_end] -= _w
+                    _end = _step
+            _leaf = _path[-1]
+            _category = _leaf.category if _leaf.category is not None else _leaf.get_category()
+            if _category == _y:
+                _diff[0] += _w
+                _diff[_end] -= _w
+        return np.cumsum(_diff[:-1]) / len(y_cv)
+
+    @CvDBaseTiming.timeit(level=1)
+    def _replay_prune(self, level, snapshots):
+        for _, node_id in self.prune_events[level:][::-1]:
+            _node, _snapshot = snapshots[node_id]
+            _node.unprune(_snapshot)
+        self.prune_events = self.prune_events[:level]
+        self.nodes = []
+        self.root.feed_tree(self)
+        self.importance[...] = 0
+        for _node in self.nodes:
+            _node.pruned = False
+            if _node.category is None:
+                self.importance[_node.feature_dim] += _node.decrease
 
     @CvDBaseTiming.timeit(level=3, prefix="[Util] ")
     def prune(self, x_cv, y_cv, weights):
         if self.root.is_cart:
             if x_cv is not None and y_cv is not None:
-                self._cart_prune()
-                _arg = np.argmax([CvDBase.acc(y_cv, tree.predict(x_cv), weights) for tree in self.roots])
-                _tar_root = self.roots[_arg]
-                self.nodes = []
-                _tar_root.feed_tree(self)
-                self.root = _tar_root
+                _paths = [self.root.get_path(xx) for xx in x_cv]
+                _snapshots = self._cart_prune()
+                _arg = np.argmax(self._cart_prune_scores(_paths, y_cv, weights))
+                self._replay_prune(_arg, _snapshots)
         else:
             self._prune()
 
@@ -153,6 +186,31 @@ class CvDBase(ClassifierBase, metaclass=ClassifierMeta):
     def predict(self, x):
         return np.array([self.predict_one(xx) for xx in x])
 
+    @CvDBaseTiming.timeit(level=3, prefix="[API] ")
+    def predict_distribution(self, x):
+        _n_class, _cache = len(self.label_dic), {}
+        rs = np.zeros((len(x), _n_class))
+        for i, xx in enumerate(x):
+            _node = self.root.get_path(xx)[-1]
+            if id(_node) not in _cache:
+                _cache[id(_node)] = _node.get_distribution(_n_class)
+            rs[i] = _cache[id(_node)]
+        return rs
+
+    @property
+    def feature_importances(self):
+        return FlatTree.normalize_importance(self.importance)
+
+    def flatten(self):
+        return FlatTree.from_tree(self)
+
+    def strip(self):
+        return self.flatten()
+
+    @CvDBaseTiming.timeit(level=2, prefix="[API] ")
+    def export(self, path):
+        self.flatten().save(path)
+
     @CvDBaseTiming.timeit(level=3, prefix="[API] ")
     def view(self):
         self.root.view()
@@ -215,9 +273,10 @@ class CvDMeta(type):
         name, bases, attr = args[:3]
         _, _node = bases
 
-        def __init__(self, whether_continuous=None, max_depth=None, node=None, **_kwargs):
+        def __init__(self, whether_continuous=None, max_depth=None, node=None,
+                     categorical_split="partition", **_kwargs):
             tmp_node = node if isinstance(node, CvDNode) else _node
-            CvDBase.__init__(self, whether_continuous, max_depth, tmp_node(**_kwargs))
+            CvDBase.__init__(self, whether_continuous, max_depth, tmp_node(**_kwargs), categorical_split)
             self.name = name
 
         attr["__init__"] = __init__
@@ -3,6 +3,7 @@ from math import log
 from b_NaiveBayes.Vectorized.MultinomialNB import MultinomialNB
 from b_NaiveBayes.Vectorized.GaussianNB import GaussianNB
 from c_CvDTree.Tree import *
+from c_CvDTree.Stump import Stump
 from d_Ensemble.RandomForest import RandomForest
 from e_SVM.Perceptron import Perceptron
 from e_SVM.KP import KernelPerceptron
@@ -26,6 +27,7 @@ class AdaBoost(ClassifierBase, metaclass=ClassifierMeta):
         "ID3": ID3Tree,
         "C45": C45Tree,
         "Cart": CartTree,
+        "Stump": Stump,
         "RF": RandomForest,
         "Perceptron": Perceptron,
         "KP": KernelPerceptron,
@@ -35,6 +37,8 @@ class AdaBoost(ClassifierBase, metaclass=ClassifierMeta):
     def __init__(self):
         self._clf, self._clfs, self._clfs_weights = "", [], []
         self._kwarg_cache = {}
+        self._method, self._labels = "binary", None
+        self._importance = None
 
     @property
     def params(self):
@@ -46,6 +50,10 @@ class AdaBoost(ClassifierBase, metaclass=ClassifierMeta):
             rs += "( " + "; ".join(tmp_rs) + " )"
         return rs
 
+    @property
+    def feature_importances(self):
+        return FlatTree.normalize_importance(self._importance)
+
     @property
     def title(self):
         rs = "Classifier: {}; Num: {}".format(self._clf, len(self._clfs))
@@ -53,38 +61,95 @@ class AdaBoost(ClassifierBase, metaclass=ClassifierMeta):
         return rs
 
     @AdaBoostTiming.timeit(level=1, prefix="[API] ")
-    def fit(self, x, y, sample_weight=None, clf=None, epoch=10, eps=1e-12, **kwargs):
+    def fit(self, x, y, sample_weight=None, clf=None, epoch=10, eps=1e-12, method="binary", **kwargs):
         x, y = np.atleast_2d(x), np.array(y)
         if clf is None:
-            clf = "Cart"
-            kwargs = {"max_depth": 1}
+            clf = "Stump"
+        if method not in ("binary", "SAMME", "SAMME.R"):
+            raise NotImplementedError("Boosting method '{}' not defined".format(method))
         self._kwarg_cache = kwargs
-        self._clf = clf
+        self._clf, self._method, self._labels = clf, method, np.unique(y)
+        self._clfs, self._clfs_weights = [], []
         if sample_weight is None:
             sample_weight = np.ones(len(y)) / len(y)
         else:
             sample_weight = np.array(sample_weight)
+        n_class = len(self._labels)
+        _y = np.searchsorted(self._labels, y)
+        self._importance = np.zeros(x.shape[1])
+        _weak_clf = AdaBoost._weak_clf[clf]
+        _fit_kwargs = {}
+        if hasattr(_weak_clf, "encode"):
+            _fit_kwargs["codes"] = _weak_clf.encode(x)
+            _fit_kwargs["order"] = _weak_clf.presort(_fit_kwargs["codes"])
         for _ in range(epoch):
-            tmp_clf = AdaBoost._weak_clf[clf](**kwargs)
-            tmp_clf.fit(x, y, sample_weight=sample_weight)
-            y_pred = tmp_clf.predict(x)
-            em = min(max((y_pred != y).astype(np.int8).dot(sample_weight[..., None])[0], eps), 1 - eps)
-            am = 0.5 * log(1 / em - 1)
-            sample_weight *= np.exp(-am * y * y_pred)
+            tmp_clf = _weak_clf(**kwargs)
+            tmp_clf.fit(x, y, sample_weight=sample_weight, **_fit_kwargs)
+            if method == "SAMME.R":
+                am = 1
+                _log_p = self._log_proba(tmp_clf, x)
+                sample_weight *= np.exp((1 - n_class) / n_class * (
+                    _log_p[np.arange(len(y)), _y] * n_class / (n_class - 1) - _log_p.sum(axis=1) / (n_class - 1)))
+            else:
+                y_pred = tmp_clf.predict(x)
+                _miss = y_pred != y
+                em = min(max(_miss.astype(np.int8).dot(sample_weight[..., None])[0], eps), 1 - eps)
+                if method == "binary":
+                    am = 0.5 * log(1 / em - 1)
+                    sample_weight *= np.exp(-am * y * y_pred)
+                else:
+                    if em >= 1 - 1 / n_class:
+                        break
+                    am = log(1 / em - 1) + log(n_class - 1)
+                    sample_weight *= np.exp(am * _miss)
             sample_weight /= np.sum(sample_weight)
-            self._clfs.append(deepcopy(tmp_clf))
+            if hasattr(tmp_clf, "feature_importances"):
+                self._importance += am * tmp_clf.feature_importances
+            self._clfs.append(tmp_clf.strip())
             self._clfs_weights.append(am)
 
+    def _log_proba(self, clf, x, eps=1e-5):
+        rs = np.full((len(x), len(self._labels)), eps)
+        _columns = np.searchsorted(self._labels, [clf.label_dic[i] for i in range(len(clf.label_dic))])
+        rs[..., _columns] = np.maximum(clf.predict_distribution(x), eps)
+        return np.log(rs / rs.sum(axis=1, keepdims=True))
+
+    def _accumulate(self, clf, am, x, rs):
+        if self._method == "binary":
+            rs += am * clf.predict(x)
+        elif self._method == "SAMME":
+            rs[np.arange(len(x)), np.searchsorted(self._labels, clf.predict(x))] += am
+        else:
+            _log_p = self._log_proba(clf, x)
+            rs += (len(self._labels) - 1) * (_log_p - _log_p.mean(axis=1, keepdims=True))
+
+    def _init_score(self, x):
+        if self._method == "binary":
+            return np.zeros(len(x))
+        return np.zeros((len(x), len(self._labels)))
+
+    def _get_result(self, rs):
+        if self._method == "binary":
+            return np.sign(rs)
+        return self._labels[np.argmax(rs, axis=1)]
+
     @AdaBoostTiming.timeit(level=1, prefix="[API] ")
     def predict(self, x, bound=None, get_raw_results=False):
         x = np.atleast_2d(x)
-        rs = np.zeros(len(x))
+        rs = self._init_score(x)
         if bound is None:
             _clfs, _clfs_weights = self._clfs, self._clfs_weights
         else:
             _clfs, _clfs_weights = self._clfs[:bound], self._clfs_weights[:bound]
         for clf, am in zip(_clfs, _clfs_weights):
-            rs += am * clf.predict(x)
+            self._accumulate(clf, am, x, rs)
         if not get_raw_results:
-            return np.sign(rs)
+            return self._get_result(rs)
         return rs
+
+    def staged_predict(self, x, get_raw_results=False):
+        x = np.atleast_2d(x)
+        rs = self._init_score(x)
+        for clf, am in zip(self._clfs, self._clfs_weights):
+            self._accumulate(clf, am, x, rs)
+            yield rs.copy() if get_raw_results else self._get_result(rs)
@@ -0,0 +1,145 @@
+import numpy as np
+
+from c_CvDTree.Hist import BinMapper, HistTree
+
+from Util.Timing import Timing
+from Util.Bases import ClassifierBase
+from Util.Metas import ClassifierMeta
+
+
+class GradientBoosting(ClassifierBase, metaclass=ClassifierMeta):
+    GradientBoostingTiming = Timing()
+
+    def __init__(self):
+        self._loss, self._labels = "logistic", None
+        self._mapper, self._init, self._trees = None, None, []
+        self._eval_curve, self.best_epoch = [], None
+
+    @property
+    def title(self):
+        return "Loss: {}; Num: {}".format(self._loss, len(self._trees))
+
+    @property
+    def eval_curve(self):
+        return np.array(self._eval_curve)
+
+    # Loss
+
+    def _target(self, y):
+        _y = np.searchsorted(self._labels, y)
+        if len(self._labels) == 2:
+            _target = _y[..., None].astype(np.float64)
+            return _target if self._loss == "logistic" else 2 * _target - 1
+        return np.eye(len(self._labels))[_y]
+
+    def _proba(self, score):
+        if score.shape[1] == 1:
+            return 1 / (1 + np.exp(-score))
+        _exp = np.exp(score - score.max(axis=1, keepdims=True))
+        return _exp / _exp.sum(axis=1, keepdims=True)
+
+    def _gradients(self, score, target):
+        if self._loss == "squared":
+            return score - target, np.ones_like(score)
+        _p = self._proba(score)
+        return _p - target, np.maximum(_p * (1 - _p), 1e-16)
+
+    def _loss_value(self, score, target, eps=1e-12):
+        if self._loss == "squared":
+            return np.mean(np.sum((score - target) ** 2, axis=1))
+        _p = np.clip(self._proba(score), eps, 1 - eps)
+        if score.shape[1] == 1:
+            return -np.mean(target * np.log(_p) + (1 - target) * np.log(1 - _p))
+        return -np.mean(np.sum(target * np.log(_p), axis=1))
+
+    def _init_score(self, target, sample_weight):
+        _mean = np.average(target, axis=0, weights=sample_weight)
+        if self._loss == "squared":
+            return _mean
+        _mean = np.clip(_mean, 1e-12, 1 - 1e-12)
+        if target.shape[1] == 1:
+            return np.log(_mean / (1 - _mean))
+        return np.log(_mean)
+
+    # Grow
+
+    @GradientBoostingTiming.timeit(level=1, prefix="[API] ")
+    def fit(self, x, y, sample_weight=None, loss="logistic", epoch=100, lr=0.1, subsample=1., colsample=1.,
+            max_bin=255, eval_set=None, patience=None, tol=0., **kwargs):
+        if loss not in ("logistic", "squared"):
+            raise NotImplementedError("Loss '{}' not defined".format(loss))
+        x, y = np.atleast_2d(x), np.array(y)
+        self._loss, self._labels = loss, np.unique(y)
+        self._mapper = BinMapper(max_bin).fit(x)
+        codes, n_bins = self._mapper.transform(x), self._mapper.n_bins
+        target = self._target(y)
+        if sample_weight is not None:
+            sample_weight = np.array(sample_weight) * len(y) / np.sum(sample_weight)
+        self._init = self._init_score(target, sample_weight)
+        self._trees, self._eval_curve, self.best_epoch = [], [], None
+        score = np.tile(self._init, (len(y), 1))
+        if eval_set is not None:
+            _eval_codes, _eval_target = self._mapper.transform(eval_set[0]), self._target(np.array(eval_set[1]))
+            _eval_score = np.tile(self._init, (len(_eval_target), 1))
+            _best_loss, self.best_epoch = np.inf, 0
+        n_row, n_feat = max(1, int(len(y) * subsample)), max(1, int(codes.shape[1] * colsample))
+        for i in range(epoch):
+            grad, hess = self._gradients(score, target)
+            if sample_weight is not None:
+                grad, hess = grad * sample_weight[..., None], hess * sample_weight[..., None]
+            _rows = None if n_row >= len(y) else np.sort(np.random.choice(len(y), n_row, replace=False))
+            _feats = None if n_feat >= codes.shape[1] else np.sort(
+                np.random.choice(codes.shape[1], n_feat, replace=False))
+            _round = []
+            for k in range(target.shape[1]):
+                _tree = HistTree(**kwargs).fit(codes, grad[..., k], hess[..., k], n_bins, _rows, _feats).flatten()
+                _tree.value *= lr
+                score[..., k] += _tree.predict_value(codes)
+                if eval_set is not None:
+                    _eval_score[..., k] += _tree.predict_value(_eval_codes)
+                _round.append(_tree)
+            self._trees.append(_round)
+            if eval_set is None:
+                continue
+            _loss = self._loss_value(_eval_score, _eval_target)
+            self._eval_curve.append(_loss)
+            if _loss < _best_loss - tol:
+                _best_loss, self.best_epoch = _loss, i
+            elif patience is not None and i - self.best_epoch >= patience:
+                break
+        if self.best_epoch is not None:
+            self._trees = self._trees[:self.best_epoch + 1]
+
+    # Predict
+
+    def _get_result(self, score):
+        if score.shape[1] == 1:
+            return self._labels[(score[..., 0] > 0).astype(np.int64)]
+        return self._labels[np.argmax(score, axis=1)]
+
+    def _accumulate(self, trees, codes, score):
+        for k, _tree in enumerate(trees):
+            score[..., k] += _tree.predict_value(codes)
+
+    @GradientBoostingTiming.timeit(level=1, prefix="[API] ")
+    def predict(self, x, bound=None, get_raw_results=False):
+        codes = self._mapper.transform(x)
+        score = np.tile(self._init, (len(codes), 1))
+        for _trees in (self._trees if bound is None else self._trees[:bound]):
+            self._accumulate(_trees, codes, score)
+        if get_raw_results:
+            return score
+        return self._get_result(score)
+
+    def predict_proba(self, x):
+        if self._loss != "logistic":
+            raise NotImplementedError("Probability for loss '{}' not defined".format(self._loss))
+        _p = self._proba(self.predict(x, get_raw_results=True))
+        return np.hstack([1 - _p, _p]) if _p.shape[1] == 1 else _p
+
+    def staged_predict(self, x, get_raw_results=False):
+        codes = self._mapper.transform(x)
+        score = np.tile(self._init, (len(codes), 1))
+        for _trees in self._trees:
+            self._accumulate(_trees, codes, score)
+            yield score.copy() if get_raw_results else self._get_result(score)
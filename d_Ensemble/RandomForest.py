@@ -1,7 +1,30 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
 from c_CvDTree.Tree import *
 
 from Util.Util import DataUtil
 
+_worker_data = {}
+
+
+def _init_worker(x_info, y, sample_weight):
+    if isinstance(x_info, np.ndarray):
+        _worker_data["x"] = x_info
+    else:
+        name, shape, dtype = x_info
+        _worker_data["shm"] = SharedMemory(name=name)
+        _worker_data["x"] = np.ndarray(shape, dtype=dtype, buffer=_worker_data["shm"].buf)
+    _worker_data["y"], _worker_data["sample_weight"] = y, sample_weight
+
+
+def _fit_shared_tree(args):
+    tree, seed, feature_bound, kwargs = args
+    _tree, _in_bag = RandomForest.fit_tree(
+        _worker_data["x"], _worker_data["y"], _worker_data["sample_weight"], tree, seed, feature_bound, kwargs)
+    return _tree.strip(), _in_bag
+
 
 class RandomForest(ClassifierBase, metaclass=ClassifierMeta):
     RandomForestTiming = Timing()
@@ -13,40 +36,134 @@ class RandomForest(ClassifierBase, metaclass=ClassifierMeta):
 
     def __init__(self):
         self._tree, self._trees = "", []
+        self._labels = None
+        self._in_bags, self._oob_curve = [], []
+        self._importance = None
 
     @property
     def title(self):
         return "Tree: {}; Num: {}".format(self._tree, len(self._trees))
 
+    @property
+    def oob_curve(self):
+        return np.array(self._oob_curve)
+
+    @property
+    def feature_importances(self):
+        if self._importance is None:
+            return None
+        return self._importance / max(1, len(self._trees))
+
+    def strip(self):
+        self._trees = [_tree.strip() for _tree in self._trees]
+        self._in_bags = []
+        return self
+
+    def in_bag(self, i, n_sample):
+        return np.unpackbits(self._in_bags[i], count=n_sample).astype(bool)
+
+    @staticmethod
+    def fit_tree(x, y, sample_weight, tree, seed, feature_bound, kwargs):
+        _random_state = np.random.RandomState(seed)
+        n_sample = len(y)
+        tmp_tree = RandomForest._cvd_trees[tree](**kwargs)
+        _indices = _random_state.randint(n_sample, size=n_sample)
+        if sample_weight is None:
+            _local_weight = None
+        else:
+            _local_weight = sample_weight[_indices]
+            _local_weight /= _local_weight.sum()
+        tmp_tree.fit(x[_indices], y[_indices], sample_weight=_local_weight, feature_bound=feature_bound,
+                     random_state=_random_state)
+        return tmp_tree, np.packbits(np.bincount(_indices, minlength=n_sample) > 0)
+
     @staticmethod
-    @RandomForestTiming.timeit(level=2, prefix="[StaticMethod] ")
-    def most_appearance(arr):
-        u, c = np.unique(arr, return_counts=True)
-        return u[np.argmax(c)]
+    def _grow(x, y, sample_weight, tree, seeds, feature_bound, n_jobs, kwargs):
+        if n_jobs <= 1 or len(seeds) <= 1:
+            for seed in seeds:
+                yield RandomForest.fit_tree(x, y, sample_weight, tree, seed, feature_bound, kwargs)
+            return
+        _shm = None
+        if x.dtype.hasobject:
+            x_info = x
+        else:
+            _shm = SharedMemory(create=True, size=max(1, x.nbytes))
+            np.ndarray(x.shape, dtype=x.dtype, buffer=_shm.buf)[...] = x
+            x_info = (_shm.name, x.shape, x.dtype.str)
+        try:
+            with ProcessPoolExecutor(min(n_jobs, len(seeds)), initializer=_init_worker,
+                                     initargs=(x_info, y, sample_weight)) as executor:
+                futures = [executor.submit(_fit_shared_tree, (tree, seed, feature_bound, kwargs)) for seed in seeds]
+                try:
+                    for future in futures:
+                        yield future.result()
+                finally:
+                    for future in futures:
+                        future.cancel()
+        finally:
+            if _shm is not None:
+                _shm.close()
+                _shm.unlink()
 
     @RandomForestTiming.timeit(level=1, prefix="[API] ")
-    def fit(self, x, y, sample_weight=None, tree="Cart", epoch=10, feature_bound="log", **kwargs):
+    def fit(self, x, y, sample_weight=None, tree="Cart", epoch=10, feature_bound="log", n_jobs=1,
+            oob=False, patience=None, tol=0., **kwargs):
         x, y = np.atleast_2d(x), np.array(y)
-        n_sample = len(y)
-        self._tree = tree
-        for _ in range(epoch):
-            tmp_tree = RandomForest._cvd_trees[tree](**kwargs)
-            _indices = np.random.randint(n_sample, size=n_sample)
-            if sample_weight is None:
-                _local_weight = None
-            else:
-                _local_weight = sample_weight[_indices]
-                _local_weight /= _local_weight.sum()
-            tmp_tree.fit(x[_indices], y[_indices], sample_weight=_local_weight, feature_bound=feature_bound)
-            self._trees.append(deepcopy(tmp_tree))
+        self._tree, self._labels = tree, np.unique(y)
+        self._trees, self._in_bags, self._oob_curve = [], [], []
+        self._importance = np.zeros(x.shape[1])
+        _seeds = np.random.randint(2 ** 31 - 1, size=epoch)
+        if n_jobs is None:
+            n_jobs = 1
+        elif n_jobs < 0:
+            n_jobs = os.cpu_count()
+        oob = oob or patience is not None
+        if oob:
+            _y = np.searchsorted(self._labels, y)
+            _oob_votes = np.zeros((len(y), len(self._labels)))
+            _best_err, _best_epoch = 1., 0
+        for i, (_tree, _in_bag) in enumerate(
+                RandomForest._grow(x, y, sample_weight, tree, _seeds, feature_bound, n_jobs, kwargs)):
+            self._importance += _tree.feature_importances
+            self._trees.append(_tree.strip())
+            self._in_bags.append(_in_bag)
+            if not oob:
+                continue
+            _oob = np.flatnonzero(~self.in_bag(i, len(y)))
+            if len(_oob):
+                _oob_votes[_oob, np.searchsorted(self._labels, _tree.predict(x[_oob]))] += 1
+            _voted = np.any(_oob_votes > 0, axis=1)
+            _acc = np.mean(np.argmax(_oob_votes[_voted], axis=1) == _y[_voted]) if np.any(_voted) else 0.
+            self._oob_curve.append(_acc)
+            if np.mean(_voted) < 0.99:
+                _best_epoch = i
+            elif 1 - _acc < _best_err - tol:
+                _best_err, _best_epoch = 1 - _acc, i
+            elif patience is not None and i - _best_epoch >= patience:
+                break
 
-    @RandomForestTiming.timeit(level=1, prefix="[API] ")
-    def predict(self, x, bound=None):
-        if bound is None:
-            _matrix = np.array([_tree.predict(x) for _tree in self._trees]).T
+    def _vote(self, tree, x, votes, voting):
+        if voting == "hard":
+            votes[np.arange(len(x)), np.searchsorted(self._labels, tree.predict(x))] += 1
+        elif voting == "soft":
+            _columns = np.searchsorted(self._labels, [tree.label_dic[i] for i in range(len(tree.label_dic))])
+            votes[..., _columns] += tree.predict_distribution(x)
         else:
-            _matrix = np.array([_tree.predict(x) for _tree in self._trees[:bound]]).T
-        return np.array([RandomForest.most_appearance(rs) for rs in _matrix])
+            raise NotImplementedError("Voting method '{}' not defined".format(voting))
+
+    @RandomForestTiming.timeit(level=1, prefix="[API] ")
+    def predict(self, x, bound=None, voting="hard"):
+        _trees = self._trees if bound is None else self._trees[:bound]
+        _votes = np.zeros((len(x), len(self._labels)))
+        for _tree in _trees:
+            self._vote(_tree, x, _votes, voting)
+        return self._labels[np.argmax(_votes, axis=1)]
+
+    def staged_predict(self, x, voting="hard"):
+        _votes = np.zeros((len(x), len(self._labels)))
+        for _tree in self._trees:
+            self._vote(_tree, x, _votes, voting)
+            yield self._labels[np.argmax(_votes, axis=1)]
 
 if __name__ == '__main__':
     import time
@@ -0,0 +1,47 @@
+import time
+import numpy as np
+
+from d_Ensemble.AdaBoost import AdaBoost
+from d_Ensemble.RandomForest import RandomForest
+from d_Ensemble.GradientBoosting import GradientBoosting
+
+from Util.Util import DataUtil
+
+_configs = [
+    ("GBDT", GradientBoosting, {"epoch": 100, "lr": 0.2, "max_depth": 3, "subsample": 0.8}),
+    ("AdaBoost", AdaBoost, {"clf": "Cart", "epoch": 20, "method": "SAMME", "max_depth": 3}),
+    ("SAMME.R", AdaBoost, {"epoch": 20, "method": "SAMME.R"}),
+    ("RF", RandomForest, {"tree": "Cart", "epoch": 20})
+]
+
+
+def benchmark(name, x, y, xt, yt):
+    print("=" * 30)
+    print("Dataset: {}".format(name))
+    print("-" * 30)
+    for algorithm, model, kwargs in _configs:
+        np.random.seed(142857)
+        ensemble = model()
+        _fit_time = time.time()
+        ensemble.fit(x, y, **kwargs)
+        _fit_time = time.time() - _fit_time
+        _predict_time = time.time()
+        _acc = np.mean(ensemble.predict(xt) == yt)
+        _predict_time = time.time() - _predict_time
+        print("{:>10s}  Acc: {:8.6f}  Fit: {:10.6f} s  Predict: {:10.6f} s".format(
+            algorithm, _acc, _fit_time, _predict_time))
+
+
+def main():
+    (x_train, y_train), (x_test, y_test) = DataUtil.get_dataset(
+        "mushroom", "../_Data/mushroom.txt", train_num=6000, tar_idx=0)
+    benchmark("mushroom", x_train, y_train, x_test, y_test)
+
+    _x, _y = DataUtil.gen_spin(size=300, n=6, n_class=3, one_hot=False)
+    _indices = np.random.permutation(len(_y))
+    _x, _y = _x[_indices], _y[_indices]
+    benchmark("spin", _x[:1200], _y[:1200], _x[1200:], _y[1200:])
+
+
+if __name__ == '__main__':
+    main()
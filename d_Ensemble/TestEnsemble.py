@@ -1,16 +1,24 @@
+import os
+import csv
 import time
+import itertools
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
 
 from d_Ensemble.AdaBoost import AdaBoost
 from d_Ensemble.RandomForest import RandomForest
+from d_Ensemble.GradientBoosting import GradientBoosting
 from _SKlearn.Ensemble import SKAdaBoost, SKRandomForest
 
 from Util.Util import DataUtil
 
 _clf_dic = {
-    "AdaBoost": AdaBoost, "RF": RandomForest,
+    "AdaBoost": AdaBoost, "RF": RandomForest, "GBDT": GradientBoosting,
     "SKAdaBoost": SKAdaBoost, "SKRandomForest": SKRandomForest
 }
+_sweep_data = {}
+_columns = ("algorithm", "params", "acc", "fit_time", "predict_time", "peak_rss")
 
 np.random.seed(142857)
 
@@ -35,6 +43,112 @@ def cv_test(x, y, xt, yt, algorithm="AdaBoost", clf="Cart", epoch=10, **kwargs):
     ensemble.estimate(xt, yt)
     print("Time cost: {:8.6} s".format(time.time() - _t))
 
+
+# Sweep
+
+def expand_grid(algorithm, **axes):
+    _keys = list(axes)
+    return [(algorithm, dict(zip(_keys, _values))) for _values in itertools.product(*axes.values())]
+
+
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _init_sweep(infos):
+    for key, info in infos.items():
+        if isinstance(info, np.ndarray):
+            _sweep_data[key] = info.view()
+        else:
+            name, shape, dtype = info
+            _sweep_data[key + "_shm"] = SharedMemory(name=name)
+            _sweep_data[key] = np.ndarray(shape, dtype=dtype, buffer=_sweep_data[key + "_shm"].buf)
+        # Data is shared by every config of the sweep, so workers must not modify it
+        _sweep_data[key].setflags(write=False)
+
+
+def _run_config(args):
+    algorithm, kwargs, seed = args
+    x, y, xt, yt = (_sweep_data[key] for key in ("x", "y", "xt", "yt"))
+    np.random.seed(seed)
+    _reset_peak_rss()
+    ensemble = _clf_dic[algorithm]()
+    _fit_time = time.time()
+    if "SK" in algorithm:
+        ensemble.set_params(**kwargs)
+        ensemble.fit(x, y)
+    else:
+        ensemble.fit(x, y, **kwargs)
+    _fit_time = time.time() - _fit_time
+    _predict_time = time.time()
+    y_pred = ensemble.predict(xt)
+    _predict_time = time.time() - _predict_time
+    return {
+        "algorithm": algorithm, "params": kwargs, "acc": float(np.mean(y_pred == yt)),
+        "fit_time": _fit_time, "predict_time": _predict_time, "peak_rss": _peak_rss()
+    }
+
+
+def show_table(results):
+    _params = [", ".join("{}={}".format(key, value) for key, value in row["params"].items()) for row in results]
+    _width = max([len(param) for param in _params] + [6])
+    print("{:>14s}  {:<{w}s}  {:>10s}  {:>12s}  {:>12s}  {:>12s}".format(
+        "algorithm", "params", "acc", "fit (s)", "predict (s)", "peak RSS(MB)", w=_width))
+    for row, param in zip(results, _params):
+        print("{:>14s}  {:<{w}s}  {:>10.6f}  {:>12.6f}  {:>12.6f}  {:>12.2f}".format(
+            row["algorithm"], param, row["acc"], row["fit_time"], row["predict_time"], row["peak_rss"], w=_width))
+
+
+def sweep(x, y, xt, yt, grid, n_jobs=-1, seed=142857, path=None):
+    data = {key: np.asarray(value) for key, value in zip(("x", "y", "xt", "yt"), (x, y, xt, yt))}
+    tasks = [(algorithm, kwargs, seed) for algorithm, kwargs in grid]
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = os.cpu_count()
+    if n_jobs <= 1 or len(tasks) <= 1:
+        _init_sweep(data)
+        results = [_run_config(task) for task in tasks]
+    else:
+        infos, _shms = {}, []
+        try:
+            for key, arr in data.items():
+                if arr.dtype.hasobject:
+                    infos[key] = arr
+                    continue
+                _shm = SharedMemory(create=True, size=max(1, arr.nbytes))
+                _shms.append(_shm)
+                np.ndarray(arr.shape, dtype=arr.dtype, buffer=_shm.buf)[...] = arr
+                infos[key] = (_shm.name, arr.shape, arr.dtype.str)
+            with ProcessPoolExecutor(min(n_jobs, len(tasks)), initializer=_init_sweep, initargs=(infos,)) as executor:
+                results = list(executor.map(_run_config, tasks))
+        finally:
+            for _shm in _shms:
+                _shm.close()
+                _shm.unlink()
+    show_table(results)
+    if path is not None:
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=_columns)
+            writer.writeheader()
+            writer.writerows(results)
+    return results
+
+
 if __name__ == '__main__':
     # _x, _y = gen_random()
     # test(_x, _y, algorithm="RF", epoch=1)
@@ -63,9 +177,4 @@ if __name__ == '__main__':
     y_train[y_train == 0] = -1
     y_test[y_test == 0] = -1
 
-    cv_test(x_train, y_train, x_test, y_test, clf="MNB", epoch=1)
-    cv_test(x_train, y_train, x_test, y_test, clf="MNB", epoch=5)
-    cv_test(x_train, y_train, x_test, y_test, clf="MNB", epoch=10)
-    cv_test(x_train, y_train, x_test, y_test, clf="MNB", epoch=15)
-
-    AdaBoost().show_timing_log()
+    sweep(x_train, y_train, x_test, y_test, expand_grid("AdaBoost", clf=["MNB"], epoch=[1, 5, 10, 15]))